@@ -10,8 +10,8 @@ load_dotenv()
 DATA_SERVICE_URL = os.getenv("DATA_SERVICE_URL", "http://localhost:8000")
 
 
-def _create_dam(dam_data):
-    response = requests.post(f"{DATA_SERVICE_URL}/dams", json=dam_data)
+def _create_dams(dams_data):
+    response = requests.post(f"{DATA_SERVICE_URL}/dams/bulk", json=dams_data)
     response.raise_for_status()
     return response.json()
 
@@ -24,6 +24,7 @@ if __name__ == "__main__":
         dams = get_dams_for_municipality(municipality['id'])
         if dams:
             print(f"Found {len(dams)} dams for municipality {municipality['name']}")
+            dams_data = []
             for dam in dams:
                 from supported_dams import SUPPORTED_DAMS
 
@@ -39,7 +40,7 @@ if __name__ == "__main__":
                         for point in location_data['polygon']
                     ]]]
                     
-                    _create_dam({
+                    dams_data.append({
                         'display_name': dam['name'],
                         'latitude': location_data['center'][0],
                         'longitude': location_data['center'][1],
@@ -59,4 +60,8 @@ if __name__ == "__main__":
                 except geocoding.GeocodingError as e:
                     print(f"Failed to geocode dam {dam['name']}: {e}")
                     continue
+
+            # One request per municipality instead of one per dam
+            if dams_data:
+                _create_dams(dams_data)
     
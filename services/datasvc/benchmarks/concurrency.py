@@ -0,0 +1,127 @@
+"""
+Throughput of the datasvc read endpoints under concurrent clients.
+
+Start two instances of the service against the same database, one per database driver:
+
+    DATABASE_DRIVER=asyncpg fastapi run main.py --port 8000
+    DATABASE_DRIVER=psycopg2 fastapi run main.py --port 8001
+
+then compare them:
+
+    python benchmarks/concurrency.py asyncpg=http://localhost:8000 psycopg2=http://localhost:8001
+
+Every client sends its next request as soon as the previous one is answered, cycling through
+the endpoints below, for --duration seconds per concurrency level.
+"""
+import argparse
+import asyncio
+import itertools
+import time
+
+import httpx
+
+
+async def _endpoints(client):
+    """Read-heavy endpoints, filled in with ids that exist in the target database."""
+    dams = (await client.get("/dams", params={"limit": 2})).json()
+    places = (await client.get("/places", params={"limit": 1})).json()
+    endpoints = ["/dams?limit=100", "/places?limit=100"]
+    if dams:
+        endpoints += [
+            f"/dams/{dams[0]['id']}",
+            f"/dams/{dams[0]['id']}/measurements?limit=100",
+            "/measurements?limit=100",
+        ]
+    if places:
+        endpoints += [f"/places/{places[0]['id']}", f"/places/{places[0]['id']}/route"]
+    if len(dams) > 1:
+        endpoints.append(f"/routes/{dams[0]['id']}/{dams[1]['id']}")
+    return endpoints
+
+
+async def _client(client, paths, deadline, latencies, errors):
+    for path in paths:
+        if time.perf_counter() >= deadline:
+            return
+        start = time.perf_counter()
+        try:
+            response = await client.get(path)
+            # 404s are fine: e.g. a place that has no route to its dam
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+                continue
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list, None if it is empty."""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+async def closed_loop(client, paths, clients, duration):
+    """
+    Have clients concurrent clients request paths in turn for duration seconds.
+
+    paths is cycled if it is a list, and may also be an endless iterator shared by the
+    clients. Returns the requests per second, latency percentiles in ms and error count.
+    """
+    if isinstance(paths, list):
+        paths = itertools.cycle(paths)
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(
+        *(_client(client, paths, deadline, latencies, errors) for _ in range(clients))
+    )
+
+    latencies.sort()
+    result = {
+        "clients": clients,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / duration,
+    }
+    for q in (50, 95, 99):
+        value = percentile(latencies, q / 100)
+        result[f"p{q}_ms"] = None if value is None else value * 1000
+    return result
+
+
+async def run_level(base_url, clients, duration):
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        endpoints = await _endpoints(client)
+        return await closed_loop(client, endpoints, clients, duration)
+
+
+def _format(value):
+    return "-" if value is None else f"{value:.1f}"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "targets", nargs="+", metavar="LABEL=URL", help="Service instances to compare"
+    )
+    parser.add_argument("--clients", type=int, nargs="+", default=[50, 100, 200])
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per level")
+    args = parser.parse_args()
+
+    print(f"{'target':<12}{'clients':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+    for target in args.targets:
+        label, _, base_url = target.partition("=")
+        for clients in args.clients:
+            result = await run_level(base_url, clients, args.duration)
+            print(
+                f"{label:<12}{clients:>8}{_format(result['rps']):>10}"
+                f"{_format(result['p50_ms']):>10}{_format(result['p95_ms']):>10}"
+                f"{result['errors']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
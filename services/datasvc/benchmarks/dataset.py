@@ -0,0 +1,379 @@
+"""
+Synthetic dams, places, water network, measurements and predictions for benchmarking datasvc.
+
+Values are generated from a seed, so two runs of a size load the same data (row ids aside).
+The rows are COPYed straight into the database; to fill the migrated, empty database of
+DATABASE_URL at the scale of the whole country, from the services directory:
+
+    python -m datasvc.benchmarks.dataset national
+"""
+import argparse
+import csv
+import io
+import math
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from sqlalchemy.sql import text
+
+from ..geometry import encode_geometry, refresh_geometry_lods
+from ..utils import calculate_spherical_distances
+
+# Bounding box of Bulgaria, (min, max) latitude and longitude
+LATITUDE_RANGE = (41.24, 44.21)
+LONGITUDE_RANGE = (22.36, 28.61)
+MUNICIPALITIES = 265
+
+# Dataset sizes. Every node is linked both ways to its neighbour along a chain through all
+# nodes, which keeps the network connected; the remaining edges are one-way links between
+# nodes a few chain positions apart, so paths stay local like real pipes.
+SIZES = {
+    "small": {"dams": 50, "places": 200, "junctions": 750, "edges": 2500, "days": 365},
+    "medium": {"dams": 500, "places": 2000, "junctions": 7500, "edges": 25000, "days": 3 * 365},
+    "large": {
+        "dams": 2000,
+        "places": 5000,
+        "junctions": 25000,
+        "edges": 75000,
+        "days": 5 * 365,
+    },
+    # Bulgaria: 4,000+ reservoirs, ~5,300 settlements and 11 years of daily bulletins
+    "national": {
+        "dams": 4200,
+        "places": 5300,
+        "junctions": 40000,
+        "edges": 100000,
+        "days": 11 * 365,
+    },
+}
+
+MEASUREMENTS_START = datetime(2015, 1, 1, tzinfo=timezone.utc)
+# Measurement and prediction rows per COPY
+COPY_CHUNK_ROWS = 200000
+
+MEASUREMENT_COLUMNS = (
+    "id",
+    "dam_id",
+    "timestamp",
+    "volume",
+    "fill_volume",
+    "avg_incoming_flow",
+    "avg_outgoing_flow",
+)
+PREDICTION_COLUMNS = ("id", "dam_id", "timestamp", "fill_volume")
+
+
+def random_points(rng, count):
+    """count (latitude, longitude) arrays spread uniformly over Bulgaria."""
+    return rng.uniform(*LATITUDE_RANGE, count), rng.uniform(*LONGITUDE_RANGE, count)
+
+
+def dam_outline(rng, latitude, longitude, radius):
+    """GeoJSON MultiPolygon in [lat, lng] order: a jagged ring of about radius degrees."""
+    vertices = int(rng.integers(12, 40))
+    angles = np.sort(rng.uniform(0, 2 * math.pi, vertices))
+    radii = radius * rng.uniform(0.5, 1.0, vertices)
+    ring = [
+        [
+            round(latitude + r * math.sin(a), 6),
+            round(longitude + r * math.cos(a) / math.cos(math.radians(latitude)), 6),
+        ]
+        for a, r in zip(angles.tolist(), radii.tolist())
+    ]
+    ring.append(list(ring[0]))
+    return {"type": "MultiPolygon", "coordinates": [[ring]]}
+
+
+def network_edges(rng, latitudes, longitudes, edge_count):
+    """(source, target) index arrays of a connected network over the given node positions."""
+    count = len(latitudes)
+    bands = np.floor((latitudes - LATITUDE_RANGE[0]) / 0.05).astype(np.int64)
+    # Alternate the longitude direction per band so consecutive bands join at their ends
+    direction = np.where(bands % 2 == 0, 1.0, -1.0)
+    order = np.lexsort((longitudes * direction, bands))
+
+    sources = [order[:-1], order[1:]]
+    targets = [order[1:], order[:-1]]
+    extra = max(edge_count - 2 * (count - 1), 0)
+    if extra:
+        positions = rng.integers(0, count - 2, extra)
+        neighbours = np.minimum(positions + rng.integers(2, 8, extra), count - 1)
+        forward = rng.random(extra) < 0.5
+        sources.append(order[np.where(forward, positions, neighbours)])
+        targets.append(order[np.where(forward, neighbours, positions)])
+    return np.concatenate(sources), np.concatenate(targets)
+
+
+def fill_fractions(rng, days):
+    """Daily fill fraction of a dam: a yearly cycle peaking in spring, with drift and noise."""
+    day = np.arange(days)
+    seasonal = 0.2 * np.sin(2 * math.pi * (day - 60) / 365.25)
+    drift = np.cumsum(rng.normal(0, 0.004, days))
+    base = rng.uniform(0.4, 0.8)
+    return np.clip(base + seasonal + drift - drift.mean(), 0.02, 1.0)
+
+
+def _ids(count):
+    return [str(uuid.uuid4()) for _ in range(count)]
+
+
+def _copy(db, table, columns, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    with db.connection().connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY false_positive.{table} ({', '.join(columns)}) FROM STDIN WITH CSV", buffer
+        )
+
+
+class Dataset:
+    """Generator of one dataset size; write() COPYs it into a database."""
+
+    def __init__(self, size, seed=0):
+        self.size = size
+        self.counts = SIZES[size]
+        self.rng = np.random.default_rng(seed)
+        self.dam_ids = []
+        self.place_ids = []
+        self.max_volumes = None
+
+    def _write_nodes(self, db, node_type, latitudes, longitudes):
+        ids = _ids(len(latitudes))
+        name = node_type.capitalize()
+        _copy(
+            db,
+            "nodes",
+            ("id", "display_name", "latitude", "longitude", "node_type"),
+            (
+                (node_id, f"{name} {i}", latitude, longitude, node_type)
+                for i, (node_id, latitude, longitude) in enumerate(
+                    zip(ids, latitudes.tolist(), longitudes.tolist())
+                )
+            ),
+        )
+        return ids
+
+    def write_places(self, db):
+        latitudes, longitudes = random_points(self.rng, self.counts["places"])
+        self.place_ids = self._write_nodes(db, "place", latitudes, longitudes)
+        count = len(self.place_ids)
+        populations = np.round(10 ** self.rng.uniform(2, 6, count)).astype(np.int64)
+        _copy(
+            db,
+            "places",
+            (
+                "id",
+                "population",
+                "consumption_per_capita",
+                "water_price",
+                "non_dam_incoming_flow",
+                "radius",
+                "municipality",
+            ),
+            zip(
+                self.place_ids,
+                populations.tolist(),
+                self.rng.uniform(0.1, 0.3, count).round(3).tolist(),
+                self.rng.uniform(2, 5, count).round(2).tolist(),
+                self.rng.uniform(0, 2, count).round(3).tolist(),
+                (300 + np.sqrt(populations) * 10).round(1).tolist(),
+                (f"Municipality {i % MUNICIPALITIES}" for i in range(count)),
+            ),
+        )
+        return latitudes, longitudes
+
+    def write_dams(self, db):
+        latitudes, longitudes = random_points(self.rng, self.counts["dams"])
+        self.dam_ids = self._write_nodes(db, "dam", latitudes, longitudes)
+        self.max_volumes = np.round(10 ** self.rng.uniform(5, 8.5, len(self.dam_ids)))
+        rows = []
+        for i, (dam_id, latitude, longitude, max_volume) in enumerate(
+            zip(self.dam_ids, latitudes.tolist(), longitudes.tolist(), self.max_volumes.tolist())
+        ):
+            # Bigger reservoirs get bigger outlines, from ~200 m to ~600 m in radius
+            radius = 0.002 + max_volume ** (1 / 3) / 2e5
+            outline = encode_geometry(dam_outline(self.rng, latitude, longitude, radius))
+            municipality = f"Municipality {i % MUNICIPALITIES}"
+            rows.append((dam_id, outline, outline, max_volume, municipality))
+        _copy(
+            db,
+            "dams",
+            ("id", "border_geometry", "border_geometry_json", "max_volume", "municipality"),
+            rows,
+        )
+        # Each dam supplies two random places
+        _copy(
+            db,
+            "dam_places",
+            ("dam_id", "place_id"),
+            (
+                (dam_id, self.place_ids[j])
+                for dam_id in self.dam_ids
+                for j in self.rng.choice(len(self.place_ids), 2, replace=False).tolist()
+            ),
+        )
+        return latitudes, longitudes
+
+    def write_junctions(self, db):
+        latitudes, longitudes = random_points(self.rng, self.counts["junctions"])
+        ids = self._write_nodes(db, "junction", latitudes, longitudes)
+        count = len(ids)
+        _copy(
+            db,
+            "junctions",
+            ("id", "source_node_id", "target_node_id", "max_flow_rate", "length"),
+            zip(
+                ids,
+                (self.dam_ids[i] for i in self.rng.integers(0, len(self.dam_ids), count)),
+                (self.place_ids[i] for i in self.rng.integers(0, len(self.place_ids), count)),
+                self.rng.uniform(0.1, 10, count).round(3).tolist(),
+                self.rng.uniform(100, 20000, count).round(1).tolist(),
+            ),
+        )
+        return ids, latitudes, longitudes
+
+    def write_edges(self, db, node_ids, latitudes, longitudes):
+        sources, targets = network_edges(self.rng, latitudes, longitudes, self.counts["edges"])
+        distances = calculate_spherical_distances(
+            latitudes[sources], longitudes[sources], latitudes[targets], longitudes[targets]
+        )
+        routing_ids = dict(
+            db.execute(text("SELECT id::text, routing_id FROM false_positive.nodes")).all()
+        )
+        _copy(
+            db,
+            "edges",
+            (
+                "id",
+                "source_node_id",
+                "target_node_id",
+                "source_routing_id",
+                "target_routing_id",
+                "distance",
+            ),
+            (
+                (
+                    edge_id,
+                    node_ids[source],
+                    node_ids[target],
+                    routing_ids[node_ids[source]],
+                    routing_ids[node_ids[target]],
+                    distance,
+                )
+                for edge_id, source, target, distance in zip(
+                    _ids(len(sources)),
+                    sources.tolist(),
+                    targets.tolist(),
+                    (distances * 1000).round(1).tolist(),  # meters
+                )
+            ),
+        )
+        return len(sources)
+
+    def write_series(self, db):
+        """Daily measurements of every dam, and a prediction of its fill volume for each day."""
+        days = self.counts["days"]
+        timestamps = [
+            (MEASUREMENTS_START + timedelta(days=day)).isoformat() for day in range(days)
+        ]
+        dams_per_chunk = max(COPY_CHUNK_ROWS // days, 1)
+        for start in range(0, len(self.dam_ids), dams_per_chunk):
+            measurements = []
+            predictions = []
+            for dam_id, max_volume in zip(
+                self.dam_ids[start : start + dams_per_chunk],
+                self.max_volumes[start : start + dams_per_chunk].tolist(),
+            ):
+                fill_volumes = fill_fractions(self.rng, days) * max_volume
+                # Outflow averages 1% of the capacity a day, inflow makes up the fill change
+                outgoing = self.rng.gamma(2.0, max_volume / 86400 / 200, days)
+                change = np.diff(fill_volumes, prepend=fill_volumes[0]) / 86400
+                incoming = np.maximum(outgoing + change, 0)
+                measurements += zip(
+                    _ids(days),
+                    [dam_id] * days,
+                    timestamps,
+                    (fill_volumes * 1.05).round(0).tolist(),
+                    fill_volumes.round(0).tolist(),
+                    incoming.round(4).tolist(),
+                    outgoing.round(4).tolist(),
+                )
+                # Forecasts miss by a few percent of the capacity
+                predicted = fill_volumes + self.rng.normal(0, 0.03 * max_volume, days)
+                predictions += zip(
+                    _ids(days),
+                    [dam_id] * days,
+                    timestamps,
+                    np.clip(predicted, 0, max_volume).round(0).tolist(),
+                )
+            _copy(db, "dam_bulletin_measurements", MEASUREMENT_COLUMNS, measurements)
+            _copy(db, "dam_predictions", PREDICTION_COLUMNS, predictions)
+
+    def write(self, db, log=print):
+        """
+        COPY the whole dataset into an empty, migrated database; the caller commits.
+
+        Derived data is then computed as the service would: outline levels of detail, latest
+        measurements, measurement rollups and the closest dam of every place.
+        """
+        # Imported here as importing them connects to DATABASE_URL
+        from ..measurements import (
+            ensure_measurement_partitions,
+            rebuild_measurement_rollups,
+            refresh_latest_measurements,
+        )
+        from ..routing import RoutingGraph, assign_closest_dams
+
+        start = time.perf_counter()
+
+        def step(message):
+            log(f"  {time.perf_counter() - start:7.1f}s {message}")
+
+        place_latitudes, place_longitudes = self.write_places(db)
+        dam_latitudes, dam_longitudes = self.write_dams(db)
+        refresh_geometry_lods(db, self.dam_ids)
+        step(f"{len(self.place_ids)} places, {len(self.dam_ids)} dams")
+
+        junction_ids, junction_latitudes, junction_longitudes = self.write_junctions(db)
+        edge_count = self.write_edges(
+            db,
+            self.place_ids + self.dam_ids + junction_ids,
+            np.concatenate([place_latitudes, dam_latitudes, junction_latitudes]),
+            np.concatenate([place_longitudes, dam_longitudes, junction_longitudes]),
+        )
+        step(f"{len(junction_ids)} junctions, {edge_count} edges")
+
+        # Yearly partitions for the whole history, rather than all of it in the default one
+        ensure_measurement_partitions(db, first_year=MEASUREMENTS_START.year)
+        self.write_series(db)
+        refresh_latest_measurements(db, self.dam_ids)
+        rebuild_measurement_rollups(db)
+        step(f"{len(self.dam_ids) * self.counts['days']} measurements and as many predictions")
+
+        assigned, unreachable = assign_closest_dams(db, RoutingGraph())
+        step(f"closest dams of {assigned} places, {unreachable} unreachable")
+
+        # Fresh statistics, so that the first queries are planned for the loaded row counts
+        db.execute(text("ANALYZE"))
+        step("analyzed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("size", choices=list(SIZES))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from ..database import SessionLocal
+
+    print(f"{args.size}: {SIZES[args.size]}")
+    with SessionLocal() as db:
+        Dataset(args.size, seed=args.seed).write(db)
+        db.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import uuid
+
+from fastapi import HTTPException
+from sqlalchemy import insert
+
+from . import models
+from .geometry import encode_geometry, flip_coordinates, refresh_geometry_lods
+from .utils import calculate_spherical_distances
+
+NODE_FIELDS = {"display_name", "latitude", "longitude"}
+
+
+def _insert_nodes(db, items, node_type):
+    """Insert the node rows of items in one multi-row statement; returns the new ids."""
+    ids = [uuid.uuid4() for _ in items]
+    db.execute(
+        insert(models.Node),
+        [
+            {
+                "id": node_id,
+                "display_name": item.display_name,
+                "latitude": item.latitude,
+                "longitude": item.longitude,
+                "node_type": node_type,
+            }
+            for node_id, item in zip(ids, items)
+        ],
+    )
+    return ids
+
+
+def create_dams(db, dams):
+    """Insert dams with their nodes, place links and simplified outlines; the caller commits."""
+    ids = _insert_nodes(db, dams, "dam")
+    rows = []
+    for dam_id, dam in zip(ids, dams):
+        border_geometry = flip_coordinates(dam.border_geometry)
+        rows.append(
+            {
+                **dam.model_dump(exclude=NODE_FIELDS | {"border_geometry", "place_ids"}),
+                "id": dam_id,
+                "border_geometry": border_geometry,
+                "border_geometry_json": encode_geometry(border_geometry),
+            }
+        )
+    db.execute(insert(models.Dam), rows)
+
+    # Like create_dam, links to places that do not exist are skipped
+    place_ids = {place_id for dam in dams for place_id in dam.place_ids}
+    if place_ids:
+        existing = {
+            place_id
+            for (place_id,) in db.query(models.Place.id).filter(models.Place.id.in_(place_ids))
+        }
+        links = [
+            {"dam_id": dam_id, "place_id": place_id}
+            for dam_id, dam in zip(ids, dams)
+            for place_id in dict.fromkeys(dam.place_ids)
+            if place_id in existing
+        ]
+        if links:
+            db.execute(insert(models.dam_places), links)
+
+    refresh_geometry_lods(db, ids)
+    return ids
+
+
+def create_places(db, places):
+    """Insert places with their nodes; the caller commits."""
+    ids = _insert_nodes(db, places, "place")
+    db.execute(
+        insert(models.Place),
+        [
+            {**place.model_dump(exclude=NODE_FIELDS), "id": place_id}
+            for place_id, place in zip(ids, places)
+        ],
+    )
+    return ids
+
+
+def create_junctions(db, junctions):
+    """Insert junctions with their nodes; the caller commits."""
+    ids = _insert_nodes(db, junctions, "junction")
+    db.execute(
+        insert(models.Junction),
+        [
+            {**junction.model_dump(exclude=NODE_FIELDS), "id": junction_id}
+            for junction_id, junction in zip(ids, junctions)
+        ],
+    )
+    return ids
+
+
+def create_edges(db, edges):
+    """
+    Insert edges with their distances computed for the whole batch at once.
+
+    Returns the (id, source, target, distance) of every new edge; the caller commits.
+    """
+    node_ids = {edge.source_node_id for edge in edges} | {edge.target_node_id for edge in edges}
+    nodes = {
+        node_id: (routing_id, float(latitude), float(longitude))
+        for node_id, routing_id, latitude, longitude in db.query(
+            models.Node.id, models.Node.routing_id, models.Node.latitude, models.Node.longitude
+        ).filter(models.Node.id.in_(node_ids))
+    }
+    missing = node_ids - nodes.keys()
+    if missing:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Nodes not found: {', '.join(str(node_id) for node_id in missing)}",
+        )
+
+    sources = [nodes[edge.source_node_id] for edge in edges]
+    targets = [nodes[edge.target_node_id] for edge in edges]
+    distances = (
+        calculate_spherical_distances(
+            [latitude for _, latitude, _ in sources],
+            [longitude for _, _, longitude in sources],
+            [latitude for _, latitude, _ in targets],
+            [longitude for _, _, longitude in targets],
+        )
+        * 1000  # Convert to meters
+    ).tolist()
+
+    ids = [uuid.uuid4() for _ in edges]
+    db.execute(
+        insert(models.Edge),
+        [
+            {
+                "id": edge_id,
+                "source_node_id": edge.source_node_id,
+                "target_node_id": edge.target_node_id,
+                "source_routing_id": source[0],
+                "target_routing_id": target[0],
+                "distance": distance,
+                "description": edge.description,
+            }
+            for edge_id, edge, source, target, distance in zip(
+                ids, edges, sources, targets, distances
+            )
+        ],
+    )
+    return [
+        (edge_id, edge.source_node_id, edge.target_node_id, distance)
+        for edge_id, edge, distance in zip(ids, edges, distances)
+    ]
@@ -0,0 +1,158 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from starlette.datastructures import Headers, MutableHeaders
+
+# Cached entries also expire after this many seconds, which bounds how stale a worker can be
+# after a write handled by another worker process
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "60"))
+RESPONSE_CACHE_SIZE = 1024
+
+# Cached GET paths and the tags whose writes invalidate them. Dams embed place names and
+# their last measurements, and nodes cover every node type.
+CACHE_RULES = [
+    (re.compile(r"^/dams(/[^/]+)?$"), {"dams", "places", "measurements"}),
+    (re.compile(r"^/places(/[^/]+)?$"), {"places"}),
+    (re.compile(r"^/junctions(/[^/]+)?$"), {"junctions"}),
+    (re.compile(r"^/edges(/[^/]+)?$"), {"edges"}),
+    (re.compile(r"^/nodes(/[^/]+)?$"), {"dams", "places", "junctions"}),
+]
+
+
+def cache_tags(path):
+    """Tags of a cacheable path, or None if responses for it are not cached."""
+    for pattern, tags in CACHE_RULES:
+        if pattern.match(path):
+            return tags
+    return None
+
+
+def weak_etag(body):
+    """
+    Weak ETag of an uncompressed body.
+
+    The compression middleware outside the cache serves identity, gzip and brotli encodings
+    of the same body, which a strong validator would have to tell apart.
+    """
+    return 'W/"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match uses the weak comparison, so W/ prefixes are ignored."""
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in candidates)
+
+
+class ResponseCache:
+    """LRU of GET response bodies keyed by path and query string, invalidated by tag."""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+        self._lock = threading.Lock()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires at, tags, raw headers, body, etag)
+        # Bumped on every invalidation, so a response computed before a write is not stored
+        # after it
+        self._generations = {}
+
+    def generation(self, tags):
+        with self._lock:
+            return tuple(self._generations.get(tag, 0) for tag in sorted(tags))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, tags, generation, raw_headers, body, etag):
+        with self._lock:
+            if generation != tuple(self._generations.get(tag, 0) for tag in sorted(tags)):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, tags, raw_headers, body, etag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *tags):
+        """Drop every cached response depending on any of tags."""
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            for key in [key for key, entry in self._entries.items() if entry[1] & set(tags)]:
+                del self._entries[key]
+
+
+class ResponseCacheMiddleware:
+    """
+    Serve repeated GETs of the CACHE_RULES paths from a ResponseCache.
+
+    Every cached response carries a weak ETag, and a matching If-None-Match is answered
+    with 304 Not Modified. Only 200 responses are stored. Requests for which bypass(scope) is
+    true are passed through untouched.
+    """
+
+    def __init__(self, app, cache, bypass=None):
+        self.app = app
+        self.cache = cache
+        self.bypass = bypass
+
+    async def __call__(self, scope, receive, send):
+        tags = cache_tags(scope["path"]) if scope["type"] == "http" else None
+        if tags is None or scope["method"] != "GET" or (self.bypass and self.bypass(scope)):
+            await self.app(scope, receive, send)
+            return
+
+        key = (scope["path"], scope["query_string"])
+        entry = self.cache.get(key)
+        if entry is None:
+            generation = self.cache.generation(tags)
+            start = {}
+            chunks = []
+
+            async def capture(message):
+                if message["type"] == "http.response.start":
+                    start.update(message)
+                else:
+                    chunks.append(message.get("body", b""))
+
+            await self.app(scope, receive, capture)
+            body = b"".join(chunks)
+            raw_headers = [
+                (name, value) for name, value in start["headers"] if name != b"content-length"
+            ]
+            if start["status"] != 200:
+                await self._send(send, start["status"], raw_headers, body)
+                return
+            etag = weak_etag(body)
+            self.cache.set(key, tags, generation, raw_headers, body, etag)
+        else:
+            _, _, raw_headers, body, etag = entry
+
+        headers = MutableHeaders(raw=list(raw_headers))
+        headers["etag"] = etag
+        headers.setdefault("cache-control", "no-cache")
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        if if_none_match is not None and etag_matches(if_none_match, etag):
+            del headers["content-type"]
+            await self._send(send, 304, headers.raw, b"")
+        else:
+            await self._send(send, 200, headers.raw, body)
+
+    @staticmethod
+    async def _send(send, status, raw_headers, body):
+        if status != 304:
+            raw_headers = [*raw_headers, (b"content-length", str(len(body)).encode())]
+        await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+        await send({"type": "http.response.body", "body": body})
@@ -1,10 +1,20 @@
 import os
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, event, text
+from fastapi import Request
+from sqlalchemy import create_engine, event, make_url, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import QueuePool
+
+from .instrumentation import (
+    InstrumentedAsyncQueuePool,
+    InstrumentedQueuePool,
+    InstrumentedReplicaAsyncQueuePool,
+    InstrumentedReplicaQueuePool,
+    instrument_engine,
+)
+from .replica import wrote_recently
 
 load_dotenv()
 
@@ -12,19 +22,46 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set")
 
-# Add connection pooling and SSL settings
-engine = create_engine(
-    DATABASE_URL,
-    pool_size=5,  # Maximum number of connections to keep in the pool
-    max_overflow=10,  # Maximum number of connections that can be created beyond pool_size
-    pool_timeout=30,  # Timeout for getting a connection from the pool
-    pool_recycle=1800,  # Recycle connections after 30 minutes
-    pool_pre_ping=True,  # Enable connection health checks
-    connect_args={
-        "sslmode": "require",  # Force SSL
-        "connect_timeout": 10,  # Connection timeout in seconds
-    },
-)
+# libpq sslmode of both engines; e.g. "disable" for the local benchmark database
+DATABASE_SSLMODE = os.getenv("DATABASE_SSLMODE", "require")
+
+
+def _create_engine(url, poolclass):
+    # Add connection pooling and SSL settings
+    return create_engine(
+        url,
+        poolclass=poolclass,  # QueuePool recording checkout waits
+        pool_size=5,  # Maximum number of connections to keep in the pool
+        max_overflow=10,  # Maximum number of connections that can be created beyond pool_size
+        pool_timeout=30,  # Timeout for getting a connection from the pool
+        pool_recycle=1800,  # Recycle connections after 30 minutes
+        pool_pre_ping=True,  # Enable connection health checks
+        connect_args={
+            "sslmode": DATABASE_SSLMODE,  # Force SSL unless overridden
+            "connect_timeout": 10,  # Connection timeout in seconds
+        },
+    )
+
+
+def _create_async_engine(url, poolclass):
+    # Same database through asyncpg; SSL is passed as a connect argument since asyncpg does
+    # not understand libpq's sslmode parameter
+    return create_async_engine(
+        make_url(url).set(drivername="postgresql+asyncpg").difference_update_query(["sslmode"]),
+        poolclass=poolclass,
+        pool_size=20,  # Requests wait on the database, not on threads, so keep more connections
+        max_overflow=10,
+        pool_timeout=30,
+        pool_recycle=1800,
+        pool_pre_ping=True,
+        connect_args={
+            "ssl": DATABASE_SSLMODE,
+            "timeout": 10,
+        },
+    )
+
+
+engine = _create_engine(DATABASE_URL, InstrumentedQueuePool)
 
 with engine.connect() as connection:
     connection.execute(text("CREATE SCHEMA IF NOT EXISTS false_positive"))
@@ -32,6 +69,33 @@ with engine.connect() as connection:
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# "asyncpg" serves the read endpoints from the async engine below, "psycopg2" keeps them on
+# the sync pool and Starlette's threadpool (for comparing the two)
+DATABASE_DRIVER = os.getenv("DATABASE_DRIVER", "asyncpg")
+
+async_engine = _create_async_engine(DATABASE_URL, InstrumentedAsyncQueuePool)
+
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Optional streaming replica serving the read-only endpoints, in its own pools. Without it
+# the read engines are the primary ones.
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+if DATABASE_READ_URL:
+    read_engine = _create_engine(DATABASE_READ_URL, InstrumentedReplicaQueuePool)
+    async_read_engine = _create_async_engine(DATABASE_READ_URL, InstrumentedReplicaAsyncQueuePool)
+    instrument_engine(read_engine)
+    instrument_engine(async_read_engine.sync_engine)
+    ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+    AsyncReadSessionLocal = async_sessionmaker(
+        async_read_engine, autoflush=False, expire_on_commit=False
+    )
+else:
+    read_engine, async_read_engine = engine, async_engine
+    ReadSessionLocal, AsyncReadSessionLocal = SessionLocal, AsyncSessionLocal
+
 Base = declarative_base()
 
 
@@ -42,3 +106,23 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_read_db(request: Request):
+    """Session on the replica, or on the primary for a client that has just written."""
+    db = SessionLocal() if wrote_recently(request.scope) else ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db(request: Request):
+    session = AsyncSessionLocal if wrote_recently(request.scope) else AsyncReadSessionLocal
+    async with session() as db:
+        yield db
@@ -0,0 +1,93 @@
+import json
+
+from sqlalchemy.sql import text
+
+# Simplified outline levels served for zoomed out maps, level -> (Douglas-Peucker tolerance
+# in degrees, decimal digits kept per coordinate). Level 0 is the stored outline itself.
+GEOMETRY_LODS = {
+    1: (0.0001, 5),  # ~10 m
+    2: (0.001, 4),  # ~100 m
+    3: (0.01, 3),  # ~1 km
+}
+
+
+def flip_coordinates(geojson):
+    """Flip coordinates in a GeoJSON object."""
+    if not geojson or not isinstance(geojson, dict):
+        return geojson
+
+    if geojson.get('type') == 'MultiPolygon':
+        # MultiPolygon structure: [ [[[x, y], [x, y], ...]], [[[x, y], ...]], ... ]
+        for polygon in geojson.get('coordinates', []):
+            for ring in polygon:
+                for coord in ring:
+                    coord[0], coord[1] = coord[1], coord[0]
+    elif geojson.get('type') == 'Polygon':
+        # Polygon structure: [[[x, y], [x, y], ...]]
+        for ring in geojson.get('coordinates', []):
+            for coord in ring:
+                coord[0], coord[1] = coord[1], coord[0]
+    elif geojson.get('type') == 'Point':
+        # Point structure: [x, y]
+        coords = geojson.get('coordinates', [])
+        if len(coords) >= 2:
+            coords[0], coords[1] = coords[1], coords[0]
+
+    return geojson
+
+
+def encode_geometry(geojson):
+    """Compact JSON encoding of a geometry, as stored in Dam.border_geometry_json."""
+    if geojson is None:
+        return None
+    return json.dumps(geojson, separators=(",", ":"))
+
+
+def lod_for_zoom(zoom):
+    """Level of detail to serve for a web map zoom level, the full outline if zoom is None."""
+    if zoom is None or zoom >= 14:
+        return 0
+    if zoom >= 11:
+        return 1
+    if zoom >= 8:
+        return 2
+    return 3
+
+
+def refresh_geometry_lods(db, dam_ids):
+    """Recompute the simplified outlines of the given dams from border_geometry_json."""
+    dam_ids = [str(dam_id) for dam_id in dam_ids]
+    db.execute(
+        text(
+            "DELETE FROM false_positive.dam_geometry_lods WHERE dam_id = ANY(CAST(:ids AS uuid[]))"
+        ),
+        {"ids": dam_ids},
+    )
+    db.execute(
+        text(
+            """
+            INSERT INTO false_positive.dam_geometry_lods (dam_id, level, geometry_json)
+            SELECT
+                d.id,
+                lod.level,
+                ST_AsGeoJSON(
+                    ST_SimplifyPreserveTopology(
+                        ST_GeomFromGeoJSON(d.border_geometry_json), lod.tolerance
+                    ),
+                    lod.precision
+                )
+            FROM false_positive.dams d
+            CROSS JOIN unnest(
+                CAST(:levels AS int[]), CAST(:tolerances AS float8[]), CAST(:precisions AS int[])
+            ) AS lod(level, tolerance, precision)
+            WHERE d.id = ANY(CAST(:ids AS uuid[]))
+            AND d.border_geometry_json IS NOT NULL
+            """
+        ),
+        {
+            "ids": dam_ids,
+            "levels": list(GEOMETRY_LODS),
+            "tolerances": [tolerance for tolerance, _ in GEOMETRY_LODS.values()],
+            "precisions": [precision for _, precision in GEOMETRY_LODS.values()],
+        },
+    )
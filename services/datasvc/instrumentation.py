@@ -0,0 +1,233 @@
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+logger = logging.getLogger(__name__)
+
+# Requests slower than this are logged together with their SQL statements
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+# Statements kept per request for the slow request log
+MAX_RECORDED_STATEMENTS = 200
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Prometheus histogram with cumulative buckets, one series per label tuple."""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.setdefault(labels, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            label_text = ",".join(
+                f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels)
+            )
+            prefix = label_text + "," if label_text else ""
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {values[-1]}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {values[-2]}")
+            lines.append(f"{self.name}_count{{{label_text}}} {values[-1]}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_DURATION = Histogram(
+    "datasvc_request_duration_seconds",
+    "Time spent handling a request.",
+    ("method", "route", "status"),
+)
+REQUEST_DB_DURATION = Histogram(
+    "datasvc_request_db_duration_seconds",
+    "Time spent executing SQL statements per request.",
+    ("method", "route"),
+)
+REQUEST_DB_STATEMENTS = Histogram(
+    "datasvc_request_db_statements",
+    "Number of SQL statements executed per request.",
+    ("method", "route"),
+    buckets=STATEMENT_BUCKETS,
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    "datasvc_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the pool.",
+    ("pool",),
+)
+
+
+class RequestStats:
+    def __init__(self):
+        self.statement_count = 0
+        self.db_time = 0.0
+        self.pool_wait = 0.0
+        # (offset from request start, duration, statement) of the first statements
+        self.statements = []
+        self.started = time.perf_counter()
+
+
+_request_stats = ContextVar("request_stats", default=None)
+
+
+def current_request_stats():
+    return _request_stats.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    end = time.perf_counter()
+    start = conn.info["query_start"].pop()
+    stats = _request_stats.get()
+    if stats is None:
+        return
+    stats.statement_count += 1
+    stats.db_time += end - start
+    if len(stats.statements) < MAX_RECORDED_STATEMENTS:
+        stats.statements.append((start - stats.started, end - start, statement))
+
+
+def instrument_engine(engine):
+    """Count and time the SQL statements a (sync) engine runs for the current request."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class _TimedCheckout:
+    """Pool mixin recording how long each checkout waited for a connection."""
+
+    metrics_label = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            wait = time.perf_counter() - start
+            POOL_CHECKOUT_WAIT.observe((self.metrics_label,), wait)
+            stats = _request_stats.get()
+            if stats is not None:
+                stats.pool_wait += wait
+
+
+class InstrumentedQueuePool(_TimedCheckout, QueuePool):
+    metrics_label = "sync"
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    metrics_label = "async"
+
+
+class InstrumentedReplicaQueuePool(InstrumentedQueuePool):
+    metrics_label = "replica_sync"
+
+
+class InstrumentedReplicaAsyncQueuePool(InstrumentedAsyncQueuePool):
+    metrics_label = "replica_async"
+
+
+def render_metrics(pools):
+    """Prometheus text exposition of the request histograms and the given {label: pool}."""
+    lines = []
+    for histogram in (
+        REQUEST_DURATION,
+        REQUEST_DB_DURATION,
+        REQUEST_DB_STATEMENTS,
+        POOL_CHECKOUT_WAIT,
+    ):
+        lines += histogram.render()
+
+    gauges = (
+        ("datasvc_pool_size", "Connections the pool keeps open.", lambda pool: pool.size()),
+        ("datasvc_pool_checked_out", "Connections in use.", lambda pool: pool.checkedout()),
+        (
+            "datasvc_pool_overflow",
+            "Connections open beyond the pool size.",
+            lambda pool: max(pool.overflow(), 0),
+        ),
+    )
+    for name, help_text, value in gauges:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        for label, pool in pools.items():
+            lines.append(f'{name}{{pool="{label}"}} {value(pool)}')
+    return "\n".join(lines) + "\n"
+
+
+class InstrumentationMiddleware:
+    """Record latency and SQL statistics of every request, logging the slow ones."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_stats.reset(token)
+            duration = time.perf_counter() - stats.started
+            # Label by route template rather than path, so ids do not explode cardinality
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            REQUEST_DURATION.observe((method, route, str(status)), duration)
+            REQUEST_DB_DURATION.observe((method, route), stats.db_time)
+            REQUEST_DB_STATEMENTS.observe((method, route), stats.statement_count)
+            if duration * 1000 >= SLOW_REQUEST_MS:
+                _log_slow_request(scope, status, duration, stats)
+
+
+def _log_slow_request(scope, status, duration, stats):
+    query_string = scope.get("query_string", b"").decode("latin-1")
+    path = scope["path"] + ("?" + query_string if query_string else "")
+    lines = [
+        f"Slow request {scope['method']} {path} -> {status} in {duration * 1000:.0f} ms: "
+        f"{stats.statement_count} statements, {stats.db_time * 1000:.0f} ms in the database, "
+        f"{stats.pool_wait * 1000:.0f} ms waiting for a connection"
+    ]
+    for offset, statement_duration, statement in stats.statements:
+        lines.append(
+            f"  +{offset * 1000:.0f} ms ({statement_duration * 1000:.1f} ms) "
+            + " ".join(statement.split())
+        )
+    logger.warning("\n".join(lines))
@@ -0,0 +1,46 @@
+"""Offline jobs for the data service, run with `python -m datasvc.jobs <job>`."""
+
+import argparse
+
+from .database import SessionLocal
+from .measurements import ensure_measurement_partitions, rebuild_measurement_rollups
+from .routing import RoutingGraph, assign_closest_dams
+
+
+def run_assign_closest_dams():
+    with SessionLocal() as db:
+        assigned, unreachable = assign_closest_dams(db, RoutingGraph())
+        db.commit()
+    print(f"Assigned closest dams to {assigned} places, {unreachable} places are unreachable")
+
+
+def run_ensure_measurement_partitions():
+    with SessionLocal() as db:
+        created = ensure_measurement_partitions(db)
+        db.commit()
+    print(f"Created measurement partitions: {', '.join(created) or 'none'}")
+
+
+def run_rebuild_measurement_rollups():
+    with SessionLocal() as db:
+        rebuild_measurement_rollups(db)
+        db.commit()
+    print("Rebuilt the weekly and monthly measurement rollups")
+
+
+JOBS = {
+    "assign-closest-dams": run_assign_closest_dams,
+    "ensure-measurement-partitions": run_ensure_measurement_partitions,
+    "rebuild-measurement-rollups": run_rebuild_measurement_rollups,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("job", choices=sorted(JOBS))
+    args = parser.parse_args()
+    JOBS[args.job]()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,122 @@
 import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
 from decimal import Decimal
+from typing import Literal, Optional
 from uuid import UUID
 
-from fastapi import Depends, FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import func
-from sqlalchemy.orm import Session, aliased
-from sqlalchemy.sql import text
-
-from . import models, schema
-from .database import engine, get_db
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from geoalchemy2 import Geography
+from pydantic import ValidationError
+from sqlalchemy import Float, cast, func, select, union
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased, defer, undefer
+
+from . import bulk, models, routing, schema
+from .cache import ResponseCache, ResponseCacheMiddleware
+from .database import (
+    DATABASE_DRIVER,
+    DATABASE_READ_URL,
+    ReadSessionLocal,
+    SessionLocal,
+    async_engine,
+    async_read_engine,
+    engine,
+    get_async_read_db,
+    get_db,
+    get_read_db,
+    read_engine,
+)
+from .geometry import encode_geometry, flip_coordinates, lod_for_zoom, refresh_geometry_lods
+from .instrumentation import InstrumentationMiddleware, render_metrics
+from .measurements import (
+    PREDICTION_SERIES_COLUMNS,
+    SERIES_RESOLUTIONS,
+    bulk_upsert_measurements,
+    downsample_series,
+    ensure_measurement_partitions,
+    measurement_series,
+    parse_measurement_rows,
+    record_latest_measurement,
+    refresh_measurement_rollups,
+    time_series,
+)
+from .pagination import NEXT_CURSOR_HEADER, set_next_cursor, time_range_page
+from .profiling import (
+    ProfilingMiddleware,
+    profile_path,
+    profiling_requested,
+    require_profile_token,
+)
+from .replica import READ_PRIMARY_HEADER, ReadYourWritesMiddleware, read_only, wrote_recently
+from .routing import RoutingGraph
+from .serialization import orjson_response, schema_columns
 from .utils import calculate_spherical_distance
 
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # brotli is optional, every client accepts gzip
+    BrotliMiddleware = None
+
 # Create tables
 models.Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="False Positive")
+routing_graph = RoutingGraph()
+
+# Upper bound on the number of (start, end) pairs a single /routes/batch call may request
+MAX_BATCH_ROUTE_PAIRS = 10000
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Partitions for this and next year, so new bulletins never land in the default partition.
+    # Long-running deployments also run the ensure-measurement-partitions job, e.g. monthly.
+    with SessionLocal() as db:
+        ensure_measurement_partitions(db)
+        db.commit()
+    if routing.ROUTING_BACKEND == "memory":
+        with SessionLocal() as db:
+            routing_graph.load(db)
+        # Seed the closest dam state so new edges can update assignments incrementally
+        routing_graph.closest_dams()
+    yield
+
+
+app = FastAPI(title="False Positive", lifespan=lifespan)
+
+# Inside the instrumentation, whose request stats provide the SQL timeline of a profile
+app.add_middleware(ProfilingMiddleware)
+
+# Inside the cache, so that it times the work behind cache misses and sees the matched route
+app.add_middleware(InstrumentationMiddleware)
+
+
+def _bypass_response_cache(scope):
+    # A cached response would not carry the X-Profile-Id of a profiled request, and may
+    # predate a write that a client has just made through another worker
+    return profiling_requested(scope) or wrote_recently(scope)
+
+
+# Added before CORS so that CORS headers are computed per request, not cached
+response_cache = ResponseCache()
+app.add_middleware(ResponseCacheMiddleware, cache=response_cache, bypass=_bypass_response_cache)
+
+# Compress responses above this many bytes, e.g. /dams with full outlines
+COMPRESSION_MIN_SIZE = 1024
+
+# Outside the cache, which keeps uncompressed bodies and negotiates per request
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_SIZE, gzip_fallback=True)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+# Sends the clients of writes to the primary for their next reads (see get_read_db)
+app.add_middleware(ReadYourWritesMiddleware)
 
 # Configure CORS
 app.add_middleware(
@@ -24,214 +125,389 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all methods
     allow_headers=["*"],  # Allow all headers
+    # Lets the cross-origin map read the header it echoes to see its own writes
+    expose_headers=[READ_PRIMARY_HEADER],
+)
+
+
+# Session used by the read endpoints ported to async def, on the replica if there is one
+read_db = get_async_read_db if DATABASE_DRIVER == "asyncpg" else get_read_db
+
+
+async def _run_db(db, fn, *args):
+    """
+    Call fn(session, *args) without blocking the event loop.
+
+    With an AsyncSession the legacy query code runs on asyncpg through run_sync; with a
+    sync Session it runs in the threadpool as sync handlers do.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args)
+    return await run_in_threadpool(fn, db, *args)
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus metrics of this worker process."""
+    pools = {"sync": engine.pool, "async": async_engine.pool}
+    if DATABASE_READ_URL:
+        pools.update(replica_sync=read_engine.pool, replica_async=async_read_engine.pool)
+    return Response(content=render_metrics(pools), media_type="text/plain; version=0.0.4")
+
+
+@app.get(
+    "/profiles/{profile_id}",
+    include_in_schema=False,
+    dependencies=[Depends(require_profile_token)],
 )
+def get_profile(profile_id: str, kind: Literal["speedscope", "sql"] = "speedscope"):
+    """Stored profile of a request profiled with the profiling token, see ProfilingMiddleware."""
+    return FileResponse(profile_path(profile_id, kind), media_type="application/json")
 
 
-def flip_coordinates(geojson):
-    """Flip coordinates in a GeoJSON object."""
-    if not geojson or not isinstance(geojson, dict):
-        return geojson
-
-    if geojson.get('type') == 'MultiPolygon':
-        # MultiPolygon structure: [ [[[x, y], [x, y], ...]], [[[x, y], ...]], ... ]
-        for polygon in geojson.get('coordinates', []):
-            for ring in polygon:
-                for coord in ring:
-                    coord[0], coord[1] = coord[1], coord[0]
-    elif geojson.get('type') == 'Polygon':
-        # Polygon structure: [[[x, y], [x, y], ...]]
-        for ring in geojson.get('coordinates', []):
-            for coord in ring:
-                coord[0], coord[1] = coord[1], coord[0]
-    elif geojson.get('type') == 'Point':
-        # Point structure: [x, y]
-        coords = geojson.get('coordinates', [])
-        if len(coords) >= 2:
-            coords[0], coords[1] = coords[1], coords[0]
-    
-    return geojson
+BBOX_QUERY = Query(
+    None,
+    description="Only return features inside this viewport: minLng,minLat,maxLng,maxLat",
+    examples=["22.3,41.2,28.6,44.2"],
+)
+
+
+def _bbox_envelope(bbox):
+    """Parse a minLng,minLat,maxLng,maxLat viewport into a PostGIS envelope."""
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(value) for value in bbox.split(","))
+    except ValueError:
+        raise HTTPException(
+            status_code=422, detail="bbox must be four numbers: minLng,minLat,maxLng,maxLat"
+        )
+    return func.ST_MakeEnvelope(min_lng, min_lat, max_lng, max_lat, 4326)
+
+
+def _node_in_envelope(envelope):
+    # Written as geometry(location) to match the expression of idx_nodes_location_geometry
+    return func.geometry(models.Node.location).op("&&")(envelope)
 
 
 # Node endpoints
 @app.get("/nodes", response_model=list[schema.Node])
-def read_nodes(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return db.query(models.Node).offset(skip).limit(limit).all()
+def read_nodes(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
+    query = db.query(*schema_columns(schema.Node, models.Node))
+    return orjson_response(query.offset(skip).limit(limit).all())
 
 
 @app.get("/nodes/{node_id}", response_model=schema.Node)
-def read_node(node_id: UUID, db: Session = Depends(get_db)):
+def read_node(node_id: UUID, db: Session = Depends(get_read_db)):
     db_node = db.query(models.Node).filter(models.Node.id == node_id).first()
     if db_node is None:
         raise HTTPException(status_code=404, detail="Node not found")
     return db_node
 
 
-@app.get("/routes/{start_node_id}/{end_node_id}", response_model=schema.ShortestPathResponse)
-def get_shortest_path(start_node_id: UUID, end_node_id: UUID, db: Session = Depends(get_db)):
-    # First verify both nodes exist
-    start_node = db.query(models.Node).filter(models.Node.id == start_node_id).first()
-    end_node = db.query(models.Node).filter(models.Node.id == end_node_id).first()
+def _load_path_node_rows(db: Session, node_ids):
+    """Load node rows with their dam/place/junction extension, keyed by node id."""
+    rows = (
+        db.query(models.Node, models.Dam, models.Place, models.Junction)
+        .outerjoin(models.Dam, models.Dam.id == models.Node.id)
+        .outerjoin(models.Place, models.Place.id == models.Node.id)
+        .outerjoin(models.Junction, models.Junction.id == models.Node.id)
+        .filter(models.Node.id.in_(node_ids))
+        .all()
+    )
+    return {node.id: (node, dam, place, junction) for node, dam, place, junction in rows}
 
-    if not start_node or not end_node:
+
+def _path_node_details(db: Session, path, by_id=None):
+    """Shape a routed path as ShortestPathNode dicts, loading its node rows if not given."""
+    if by_id is None:
+        by_id = _load_path_node_rows(db, [node_id for node_id, _ in path])
+
+    path_nodes = []
+    for node_id, distance_from_start in path:
+        node, dam, place, junction = by_id[node_id]
+        node_data = {
+            "id": node.id,
+            "node_type": node.node_type,
+            "display_name": node.display_name,
+            "latitude": float(node.latitude),
+            "longitude": float(node.longitude),
+            "distance_from_start": float(distance_from_start),
+        }
+
+        # Add type-specific data
+        if node.node_type == "dam" and dam is not None and dam.max_volume is not None:
+            node_data["dam_data"] = {
+                "max_volume": float(dam.max_volume),
+                "description": dam.description,
+                "municipality": dam.municipality,
+                "owner": dam.owner,
+                "operator": dam.operator,
+            }
+        elif node.node_type == "place" and place is not None and place.population is not None:
+            node_data["place_data"] = {
+                "population": place.population,
+                "consumption_per_capita": float(place.consumption_per_capita),
+                "water_price": float(place.water_price),
+                "non_dam_incoming_flow": float(place.non_dam_incoming_flow),
+                "radius": float(place.radius),
+                "municipality": place.municipality,
+            }
+        elif (
+            node.node_type == "junction"
+            and junction is not None
+            and junction.max_flow_rate is not None
+        ):
+            node_data["junction_data"] = {
+                "max_flow_rate": float(junction.max_flow_rate),
+                "current_flow_rate": (
+                    float(junction.current_flow_rate)
+                    if junction.current_flow_rate is not None
+                    else None
+                ),
+                "length": float(junction.length),
+                "source_node_id": junction.source_node_id,
+                "target_node_id": junction.target_node_id,
+            }
+
+        path_nodes.append(node_data)
+
+    return path_nodes
+
+
+def _pgrouting_path(db: Session, start_node_id, end_node_id):
+    found = db.query(models.Node.id).filter(models.Node.id.in_([start_node_id, end_node_id]))
+    if found.count() < len({start_node_id, end_node_id}):
         raise HTTPException(status_code=404, detail="Start or end node not found")
 
-    # Get the shortest path using pgr_dijkstra
-    setup_query = text(
-        """
-        -- Create temporary tables for our node mapping
-        CREATE TEMPORARY TABLE IF NOT EXISTS temp_node_mapping (
-            id uuid PRIMARY KEY,
-            node_number bigint
-        );
-        
-        INSERT INTO temp_node_mapping (id, node_number)
-        SELECT id, ROW_NUMBER() OVER () as node_number
-        FROM false_positive.nodes;
-        
-        -- Create temporary table for edge mapping
-        CREATE TEMPORARY TABLE IF NOT EXISTS temp_edge_mapping (
-            id bigint,
-            source bigint,
-            target bigint,
-            cost float
-        );
-        
-        INSERT INTO temp_edge_mapping (id, source, target, cost)
-        SELECT 
-            ROW_NUMBER() OVER ()::bigint as id,
-            src.node_number as source,
-            tgt.node_number as target,
-            e.distance as cost
-        FROM false_positive.edges e
-        JOIN temp_node_mapping src ON e.source_node_id = src.id
-        JOIN temp_node_mapping tgt ON e.target_node_id = tgt.id;
-    """
-    )
+    return routing.pgrouting_shortest_path(db, start_node_id, end_node_id)
 
-    path_query = text(
-        """
-        WITH path AS (
-            SELECT 
-                node as node_number,
-                edge,
-                agg_cost as distance_from_start
-            FROM pgr_dijkstra(
-                'SELECT id, source, target, cost FROM temp_edge_mapping',
-                (SELECT node_number FROM temp_node_mapping WHERE id = :start),
-                (SELECT node_number FROM temp_node_mapping WHERE id = :end)
-            )
+
+def _existing_node_ids(db: Session, node_ids):
+    """Those of node_ids that are in the nodes table."""
+    return {
+        node_id for (node_id,) in db.query(models.Node.id).filter(models.Node.id.in_(node_ids))
+    }
+
+
+def _sync_session(db):
+    """New sync Session on the database of db, which may be an AsyncSession."""
+    if isinstance(db, AsyncSession):
+        on_primary = db.bind is async_engine
+    else:
+        on_primary = db.bind is engine
+    return SessionLocal() if on_primary else ReadSessionLocal()
+
+
+def _memory_shortest_path(db, start_node_id, end_node_id):
+    """Sync routing_graph for the two existing nodes and search it; runs in the threadpool."""
+    with _sync_session(db) as sync_db:
+        routing_graph.sync(sync_db, {start_node_id, end_node_id})
+    return routing_graph.shortest_path(start_node_id, end_node_id)
+
+
+@app.get("/routes/{start_node_id}/{end_node_id}", response_model=schema.ShortestPathResponse)
+async def get_shortest_path(start_node_id: UUID, end_node_id: UUID, db=Depends(read_db)):
+    if routing.ROUTING_BACKEND == "pgrouting":
+        path = await _run_db(db, _pgrouting_path, start_node_id, end_node_id)
+    else:
+        # Unknown ids are answered without touching the graph
+        existing = await _run_db(db, _existing_node_ids, {start_node_id, end_node_id})
+        if len(existing) < len({start_node_id, end_node_id}):
+            raise HTTPException(status_code=404, detail="Start or end node not found")
+
+        # A reload of the graph and the search are CPU-bound, keep them off the event loop
+        path = await run_in_threadpool(_memory_shortest_path, db, start_node_id, end_node_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="No path found between the specified nodes")
+
+    path_nodes = await _run_db(db, _path_node_details, path)
+
+    # Total distance is the distance_from_start of the last node
+    total_distance = float(path_nodes[-1]["distance_from_start"]) if path_nodes else 0.0
+
+    return {"path": path_nodes, "total_distance": total_distance}
+
+
+@app.post(
+    "/routes/batch",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "description": "One BatchRouteResult JSON object per line",
+            "content": {
+                "application/x-ndjson": {
+                    "schema": {"$ref": "#/components/schemas/BatchRouteResult"}
+                }
+            },
+        }
+    },
+)
+@read_only
+def get_shortest_paths_batch(batch: schema.BatchRouteRequest, db: Session = Depends(get_read_db)):
+    # Checked before the sources x targets product is expanded into pairs
+    if len(batch.pairs) + len(batch.sources) * len(batch.targets) > MAX_BATCH_ROUTE_PAIRS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BATCH_ROUTE_PAIRS} routes can be requested at once",
         )
-        SELECT 
-            n.id,
-            n.node_type,
-            n.display_name,
-            n.latitude,
-            n.longitude,
-            COALESCE(p.distance_from_start, 0) as distance_from_start,
-            -- Dam specific fields
-            d.max_volume as dam_max_volume,
-            d.description as dam_description,
-            d.municipality as dam_municipality,
-            d.owner as dam_owner,
-            d.operator as dam_operator,
-            -- Place specific fields
-            pl.population as place_population,
-            pl.consumption_per_capita as place_consumption_per_capita,
-            pl.water_price as place_water_price,
-            pl.non_dam_incoming_flow as place_non_dam_incoming_flow,
-            pl.radius as place_radius,
-            pl.municipality as place_municipality,
-            -- Junction specific fields
-            j.max_flow_rate as junction_max_flow_rate,
-            j.current_flow_rate as junction_current_flow_rate,
-            j.length as junction_length,
-            j.source_node_id as junction_source_node_id,
-            j.target_node_id as junction_target_node_id
-        FROM path p
-        JOIN temp_node_mapping ni ON p.node_number = ni.node_number
-        JOIN false_positive.nodes n ON n.id = ni.id
-        LEFT JOIN false_positive.dams d ON d.id = n.id
-        LEFT JOIN false_positive.places pl ON pl.id = n.id
-        LEFT JOIN false_positive.junctions j ON j.id = n.id
-        ORDER BY p.distance_from_start;
-    """
-    )
 
-    cleanup_query = text(
-        """
-        DROP TABLE IF EXISTS temp_node_mapping;
-        DROP TABLE IF EXISTS temp_edge_mapping;
-    """
+    targets_by_source = _group_batch_routes(batch)
+    requested = set(targets_by_source).union(*targets_by_source.values())
+    existing = _existing_node_ids(db, requested)
+    if routing.ROUTING_BACKEND == "pgrouting":
+        paths_by_source = {
+            source_id: routing.pgrouting_shortest_paths_from(db, source_id, target_ids)
+            for source_id, target_ids in targets_by_source.items()
+        }
+    else:
+        routing_graph.sync(db, existing)
+        paths_by_source = {
+            source_id: routing_graph.shortest_paths_from(source_id, target_ids)
+            for source_id, target_ids in targets_by_source.items()
+        }
+
+    # Every node that appears on any path, loaded in one query before streaming starts
+    node_ids = {
+        node_id
+        for paths in paths_by_source.values()
+        for path in paths.values()
+        if path
+        for node_id, _ in path
+    }
+    by_id = _load_path_node_rows(db, node_ids) if node_ids else {}
+    return StreamingResponse(
+        _batch_route_lines(db, targets_by_source, paths_by_source, existing, by_id),
+        media_type="application/x-ndjson",
     )
 
-    try:
-        # Setup temporary tables
-        db.execute(setup_query)
 
-        # Get the path
-        result = db.execute(
-            path_query, {"start": str(start_node_id), "end": str(end_node_id)}
-        ).fetchall()
+def _group_batch_routes(batch: schema.BatchRouteRequest):
+    """Requested routes as {source: [targets]}, so that each source is searched only once."""
+    targets_by_source = {}
+    for pair in batch.pairs:
+        targets_by_source.setdefault(pair.start_node_id, []).append(pair.end_node_id)
+    for source_id in batch.sources:
+        targets_by_source.setdefault(source_id, []).extend(batch.targets)
+    return targets_by_source
+
+
+def _batch_route_lines(db: Session, targets_by_source, paths_by_source, existing, by_id):
+    """NDJSON BatchRouteResult lines in request order; by_id holds the rows of path nodes."""
+    for source_id, target_ids in targets_by_source.items():
+        for target_id in target_ids:
+            result = {"start_node_id": source_id, "end_node_id": target_id}
+            path = paths_by_source[source_id][target_id]
+            if path:
+                path_nodes = _path_node_details(db, path, by_id)
+                result["path"] = path_nodes
+                result["total_distance"] = path_nodes[-1]["distance_from_start"]
+            elif source_id not in existing or target_id not in existing:
+                result["error"] = "Start or end node not found"
+            else:
+                result["error"] = "No path found between the specified nodes"
+            yield schema.BatchRouteResult.model_validate(result).model_dump_json() + "\n"
+
+
+def _dam_query(db: Session, geometry_level=0):
+    """Dams joined with their nodes, loading the pre-encoded geometry instead of the JSONB."""
+    query = (
+        db.query(models.Dam, models.Node)
+        .join(models.Node, models.Dam.id == models.Node.id)
+        .options(defer(models.Dam.border_geometry))
+    )
+    if geometry_level == 0:
+        query = query.options(undefer(models.Dam.border_geometry_json))
+    return query
 
-        if not result:
-            raise HTTPException(status_code=404, detail="No path found between the specified nodes")
-
-        # Convert the results to our response format
-        path_nodes = []
-        for row in result:
-            node_data = {
-                "id": row.id,
-                "node_type": row.node_type,
-                "display_name": row.display_name,
-                "latitude": float(row.latitude),
-                "longitude": float(row.longitude),
-                "distance_from_start": float(row.distance_from_start),
-            }
 
-            # Add type-specific data
-            if row.node_type == "dam" and row.dam_max_volume is not None:
-                node_data["dam_data"] = {
-                    "max_volume": float(row.dam_max_volume),
-                    "description": row.dam_description,
-                    "municipality": row.dam_municipality,
-                    "owner": row.dam_owner,
-                    "operator": row.dam_operator,
-                }
-            elif row.node_type == "place" and row.place_population is not None:
-                node_data["place_data"] = {
-                    "population": row.place_population,
-                    "consumption_per_capita": float(row.place_consumption_per_capita),
-                    "water_price": float(row.place_water_price),
-                    "non_dam_incoming_flow": float(row.place_non_dam_incoming_flow),
-                    "radius": float(row.place_radius),
-                    "municipality": row.place_municipality,
-                }
-            elif row.node_type == "junction" and row.junction_max_flow_rate is not None:
-                node_data["junction_data"] = {
-                    "max_flow_rate": float(row.junction_max_flow_rate),
-                    "current_flow_rate": (
-                        float(row.junction_current_flow_rate)
-                        if row.junction_current_flow_rate is not None
-                        else None
-                    ),
-                    "length": float(row.junction_length),
-                    "source_node_id": row.junction_source_node_id,
-                    "target_node_id": row.junction_target_node_id,
-                }
+def _dam_responses(db: Session, dam_rows, geometry_level=0):
+    """
+    Combine (dam, node) rows with their places and last 2 measurements into Dam JSON.
 
-            path_nodes.append(node_data)
+    Runs a constant number of queries however many dams are listed: one for the place
+    names of all dams, one windowed query for their measurements and, for simplified
+    outlines, one for the outlines at geometry_level and one for the full outlines of dams
+    without them. The geometry is spliced in as pre-encoded JSON without being parsed or
+    validated again.
+    """
+    dam_ids = [dam.id for dam, _ in dam_rows]
+    if not dam_ids:
+        return []
+
+    places_by_dam = {dam_id: [] for dam_id in dam_ids}
+    place_rows = (
+        db.query(models.dam_places.c.dam_id, models.Node.id, models.Node.display_name)
+        .join(models.Node, models.Node.id == models.dam_places.c.place_id)
+        .filter(models.dam_places.c.dam_id.in_(dam_ids))
+        .all()
+    )
+    for dam_id, place_id, display_name in place_rows:
+        places_by_dam[dam_id].append({"id": place_id, "display_name": display_name})
+
+    # Last 2 measurements of every dam, ranked newest first within each dam
+    ranked = (
+        db.query(
+            models.DamBulletinMeasurement,
+            func.row_number()
+            .over(
+                partition_by=models.DamBulletinMeasurement.dam_id,
+                order_by=models.DamBulletinMeasurement.timestamp.desc(),
+            )
+            .label("rank"),
+        )
+        .filter(models.DamBulletinMeasurement.dam_id.in_(dam_ids))
+        .subquery()
+    )
+    measurement = aliased(models.DamBulletinMeasurement, ranked)
+    measurements_by_dam = {dam_id: [] for dam_id in dam_ids}
+    measurement_rows = (
+        db.query(measurement)
+        .filter(ranked.c.rank <= 2)
+        .order_by(measurement.dam_id, measurement.timestamp.asc())
+        .all()
+    )
+    for row in measurement_rows:
+        measurements_by_dam[row.dam_id].append(row)
+
+    lods = {}
+    if geometry_level > 0:
+        lods = dict(
+            db.query(models.DamGeometryLod.dam_id, models.DamGeometryLod.geometry_json).filter(
+                models.DamGeometryLod.dam_id.in_(dam_ids),
+                models.DamGeometryLod.level == geometry_level,
+            )
+        )
+        # Dams without a simplified outline fall back to the full one. It is a deferred
+        # column, so it is loaded for all of them at once instead of lazily per dam.
+        fallback_ids = [dam_id for dam_id in dam_ids if dam_id not in lods]
+        if fallback_ids:
+            lods.update(
+                db.query(models.Dam.id, models.Dam.border_geometry_json).filter(
+                    models.Dam.id.in_(fallback_ids)
+                )
+            )
 
-        # Total distance is the distance_from_start of the last node
-        total_distance = float(path_nodes[-1]["distance_from_start"]) if path_nodes else 0.0
+    responses = []
+    for dam, node in dam_rows:
+        dam_dict = {
+            **dam.__dict__,
+            "border_geometry": None,
+            "display_name": node.display_name,
+            "latitude": node.latitude,
+            "longitude": node.longitude,
+            "created_at": node.created_at,
+            "updated_at": node.updated_at,
+            "places": places_by_dam[dam.id],
+            "measurements": measurements_by_dam[dam.id],
+        }
+        body = schema.Dam.model_validate(dam_dict).model_dump_json(exclude={"border_geometry"})
+        geometry_json = lods.get(dam.id) if geometry_level > 0 else dam.border_geometry_json
+        geometry_json = geometry_json or "null"
+        responses.append('{"border_geometry":' + geometry_json + "," + body[1:])
+    return responses
 
-        return {"path": path_nodes, "total_distance": total_distance}
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error calculating shortest path: {str(e)}")
-    finally:
-        # Clean up temporary tables
-        db.execute(cleanup_query)
-        db.commit()
+def _json_response(content):
+    return Response(content=content, media_type="application/json")
 
 
 # Dam endpoints
@@ -250,10 +526,12 @@ def create_dam(dam: schema.DamCreate, db: Session = Depends(get_db)):
         db.add(db_node)
         db.flush()  # Ensure the node is created before the dam
 
-        # Create dam with same ID
+        # Create dam with same ID, storing the geometry in the orientation we serve it in
+        border_geometry = flip_coordinates(dam.border_geometry)
         db_dam = models.Dam(
             id=node_id,
-            border_geometry=dam.border_geometry,
+            border_geometry=border_geometry,
+            border_geometry_json=encode_geometry(border_geometry),
             max_volume=dam.max_volume,
             description=dam.description,
             municipality=dam.municipality,
@@ -269,116 +547,95 @@ def create_dam(dam: schema.DamCreate, db: Session = Depends(get_db)):
             db_dam.places = places
 
         db.add(db_dam)
+        db.flush()
+        refresh_geometry_lods(db, [node_id])
 
         # Commit both records in a single transaction
         db.commit()
+        response_cache.invalidate("dams")
         db.refresh(db_dam)
         db.refresh(db_node)
+        routing_graph.add_node(node_id, "dam")
 
         # Return combined dam info
-        return {
-            **db_dam.__dict__,
-            "border_geometry": flip_coordinates(db_dam.border_geometry),
-            "display_name": db_node.display_name,
-            "latitude": db_node.latitude,
-            "longitude": db_node.longitude,
-            "created_at": db_node.created_at,
-            "updated_at": db_node.updated_at,
-            "places": [
-                {"id": place.id, "display_name": db.query(models.Node).get(place.id).display_name}
-                for place in db_dam.places
-            ],
-        }
+        return _json_response(_dam_responses(db, [(db_dam, db_node)])[0])
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/dams", response_model=list[schema.Dam])
-def read_dams(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    # Get dams with their nodes
-    dams = (
-        db.query(models.Dam, models.Node)
-        .join(models.Node, models.Dam.id == models.Node.id)
-        .offset(skip)
-        .limit(limit)
-        .all()
-    )
+def _bulk_create_nodes(db: Session, items, create, node_type):
+    """Run one of the bulk.create_* helpers in a transaction and add the nodes to the graph."""
+    if not items:
+        return {"ids": []}
+    try:
+        ids = create(db, items)
+        db.commit()
+        response_cache.invalidate(f"{node_type}s")
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    for node_id in ids:
+        routing_graph.add_node(node_id, node_type)
+    return {"ids": ids}
+
+
+@app.post("/dams/bulk", response_model=schema.BulkCreateResult)
+def bulk_create_dams(dams: list[schema.DamCreate], db: Session = Depends(get_db)):
+    """Create many dams in one transaction, e.g. when loading the national registry."""
+    return _bulk_create_nodes(db, dams, bulk.create_dams, "dam")
+
 
-    result = []
-    for dam, node in dams:
-        # Get last 2 measurements for this dam
-        measurements = (
-            db.query(models.DamBulletinMeasurement)
-            .filter(models.DamBulletinMeasurement.dam_id == dam.id)
-            .order_by(models.DamBulletinMeasurement.timestamp.desc())
-            .limit(2)
-            .all()
+ZOOM_QUERY = Query(
+    None, ge=0, le=22, description="Map zoom level; lower zooms get simplified outlines"
+)
+
+
+def _read_dams(db: Session, skip, limit, zoom, bbox):
+    geometry_level = lod_for_zoom(zoom)
+    # Get dams with their nodes
+    query = _dam_query(db, geometry_level)
+    if bbox is not None:
+        envelope = _bbox_envelope(bbox)
+        # A dam is visible if its point or any part of its outline's box is in view. OR-ing
+        # the two predicates across the join would rule out both GiST indexes, so each one
+        # drives its own id scan.
+        visible_ids = union(
+            select(models.Node.id).where(
+                models.Node.node_type == "dam", _node_in_envelope(envelope)
+            ),
+            select(models.Dam.id).where(models.Dam.border_bbox.op("&&")(envelope)),
         )
-        # Reverse to get chronological order
-        measurements.reverse()
+        query = query.filter(models.Dam.id.in_(visible_ids))
+    dams = query.offset(skip).limit(limit).all()
+    return _json_response("[" + ",".join(_dam_responses(db, dams, geometry_level)) + "]")
 
-        # Combine dam info with node info and measurements
-        dam_dict = {
-            **dam.__dict__,
-            "border_geometry": flip_coordinates(dam.border_geometry),
-            "display_name": node.display_name,
-            "latitude": node.latitude,
-            "longitude": node.longitude,
-            "created_at": node.created_at,
-            "updated_at": node.updated_at,
-            "places": [
-                {"id": place.id, "display_name": db.query(models.Node).get(place.id).display_name}
-                for place in dam.places
-            ],
-            "measurements": measurements,
-        }
-        result.append(dam_dict)
 
-    return result
+@app.get("/dams", response_model=list[schema.Dam])
+async def read_dams(
+    skip: int = 0,
+    limit: int = 100,
+    zoom: Optional[int] = ZOOM_QUERY,
+    bbox: Optional[str] = BBOX_QUERY,
+    db=Depends(read_db),
+):
+    return await _run_db(db, _read_dams, skip, limit, zoom, bbox)
 
 
-@app.get("/dams/{dam_id}", response_model=schema.Dam)
-def read_dam(dam_id: UUID, db: Session = Depends(get_db)):
+def _read_dam(db: Session, dam_id, zoom):
+    geometry_level = lod_for_zoom(zoom)
     # Get dam with its node
-    result = (
-        db.query(models.Dam, models.Node)
-        .join(models.Node, models.Dam.id == models.Node.id)
-        .filter(models.Dam.id == dam_id)
-        .first()
-    )
+    result = _dam_query(db, geometry_level).filter(models.Dam.id == dam_id).first()
 
     if not result:
         raise HTTPException(status_code=404, detail="Dam not found")
 
-    dam, node = result
+    return _json_response(_dam_responses(db, [result], geometry_level)[0])
 
-    # Get last 2 measurements for this dam
-    measurements = (
-        db.query(models.DamBulletinMeasurement)
-        .filter(models.DamBulletinMeasurement.dam_id == dam_id)
-        .order_by(models.DamBulletinMeasurement.timestamp.desc())
-        .limit(2)
-        .all()
-    )
-    # Reverse to get chronological order
-    measurements.reverse()
 
-    # Return combined dam info
-    return {
-        **dam.__dict__,
-        "border_geometry": flip_coordinates(dam.border_geometry),
-        "display_name": node.display_name,
-        "latitude": node.latitude,
-        "longitude": node.longitude,
-        "created_at": node.created_at,
-        "updated_at": node.updated_at,
-        "places": [
-            {"id": place.id, "display_name": db.query(models.Node).get(place.id).display_name}
-            for place in dam.places
-        ],
-        "measurements": measurements,
-    }
+@app.get("/dams/{dam_id}", response_model=schema.Dam)
+async def read_dam(dam_id: UUID, zoom: Optional[int] = ZOOM_QUERY, db=Depends(read_db)):
+    return await _run_db(db, _read_dam, dam_id, zoom)
 
 
 @app.patch("/dams/{dam_id}", response_model=schema.Dam)
@@ -406,7 +663,10 @@ def update_dam(dam_id: UUID, dam: schema.DamUpdate, db: Session = Depends(get_db
 
         # Update dam fields if provided
         if dam.border_geometry is not None:
-            db_dam.border_geometry = dam.border_geometry
+            db_dam.border_geometry = flip_coordinates(dam.border_geometry)
+            db_dam.border_geometry_json = encode_geometry(db_dam.border_geometry)
+            db.flush()
+            refresh_geometry_lods(db, [dam_id])
         if dam.max_volume is not None:
             db_dam.max_volume = dam.max_volume
         if dam.description is not None:
@@ -428,35 +688,72 @@ def update_dam(dam_id: UUID, dam: schema.DamUpdate, db: Session = Depends(get_db
             db_dam.places = places
 
         db.commit()
+        response_cache.invalidate("dams")
         db.refresh(db_dam)
         db.refresh(db_node)
 
         # Return combined dam info
-        return {
-            **db_dam.__dict__,
-            "display_name": db_node.display_name,
-            "latitude": db_node.latitude,
-            "longitude": db_node.longitude,
-            "created_at": db_node.created_at,
-            "updated_at": db_node.updated_at,
-            "places": [
-                {"id": place.id, "display_name": db.query(models.Node).get(place.id).display_name}
-                for place in db_dam.places
-            ],
-        }
+        return _json_response(_dam_responses(db, [(db_dam, db_node)])[0])
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/dams/{dam_id}/measurements", response_model=list[schema.DamBulletinMeasurement])
-def get_dam_measurements(dam_id: UUID, db: Session = Depends(get_db)):
-    return (
-        db.query(models.DamBulletinMeasurement)
-        .filter(models.DamBulletinMeasurement.dam_id == dam_id)
-        .order_by(models.DamBulletinMeasurement.timestamp.asc())
-        .all()
+FROM_QUERY = Query(None, alias="from", description="Only rows at or after this time")
+TO_QUERY = Query(None, description="Only rows before this time")
+CURSOR_QUERY = Query(None, description=f"Value of {NEXT_CURSOR_HEADER} from the previous page")
+RESOLUTION_QUERY = Query("day", description=f"Bucket width, one of {', '.join(SERIES_RESOLUTIONS)}")
+MAX_POINTS_QUERY = Query(None, ge=3, description="Reduce the buckets to at most this many points")
+
+
+def _measurement_page(db: Session, dam_id, from_, to, cursor, limit, skip=0):
+    """One time-range page of measurements, of a single dam unless dam_id is None."""
+    query = db.query(
+        *schema_columns(schema.DamBulletinMeasurement, models.DamBulletinMeasurement)
     )
+    if dam_id is not None:
+        query = query.filter(models.DamBulletinMeasurement.dam_id == dam_id)
+    query = time_range_page(query, models.DamBulletinMeasurement, from_, to, cursor, limit)
+    if skip:
+        query = query.offset(skip)
+    return query.all()
+
+
+@app.get("/dams/{dam_id}/measurements", response_model=list[schema.DamBulletinMeasurement])
+async def get_dam_measurements(
+    dam_id: UUID,
+    from_: Optional[datetime] = FROM_QUERY,
+    to: Optional[datetime] = TO_QUERY,
+    cursor: Optional[str] = CURSOR_QUERY,
+    limit: Optional[int] = Query(None, ge=1, description="Page size, unbounded by default"),
+    db=Depends(read_db),
+):
+    """
+    A dam's measurements, a cursor page at a time.
+
+    Aggregates per day, week or month are served by /dams/{dam_id}/measurements/series, as
+    buckets have a schema of their own and are not paged.
+    """
+    measurements = await _run_db(db, _measurement_page, dam_id, from_, to, cursor, limit)
+    response = orjson_response(measurements)
+    set_next_cursor(response, measurements, limit)
+    return response
+
+
+@app.get(
+    "/dams/{dam_id}/measurements/series", response_model=list[schema.DamMeasurementBucket]
+)
+async def get_dam_measurement_series(
+    dam_id: UUID,
+    resolution: Literal["day", "week", "month"] = RESOLUTION_QUERY,
+    from_: Optional[datetime] = FROM_QUERY,
+    to: Optional[datetime] = TO_QUERY,
+    max_points: Optional[int] = MAX_POINTS_QUERY,
+    db=Depends(read_db),
+):
+    """Measurements aggregated per bucket in the database, for charts over long ranges."""
+    buckets = await _run_db(db, measurement_series, dam_id, resolution, from_, to)
+    return downsample_series(buckets, max_points)
 
 
 @app.post("/dams/{dam_id}/measurements", response_model=schema.DamBulletinMeasurement)
@@ -465,7 +762,21 @@ def create_dam_measurement(
 ):
     db_measurement = models.DamBulletinMeasurement(**measurement.model_dump())
     db.add(db_measurement)
+    try:
+        db.flush()
+    except IntegrityError as e:
+        db.rollback()
+        if "uq_dam_bulletin_measurements_dam_id_timestamp" not in str(e.orig):
+            raise
+        raise HTTPException(
+            status_code=409,
+            detail="The dam already has a measurement at this timestamp; "
+            "POST /measurements/bulk overwrites existing measurements",
+        )
+    record_latest_measurement(db, db_measurement)
+    refresh_measurement_rollups(db, [(db_measurement.dam_id, db_measurement.timestamp)])
     db.commit()
+    response_cache.invalidate("measurements")
     db.refresh(db_measurement)
     return db_measurement
 
@@ -500,8 +811,10 @@ def create_place(place: schema.PlaceCreate, db: Session = Depends(get_db)):
 
         # Commit both records in a single transaction
         db.commit()
+        response_cache.invalidate("places")
         db.refresh(db_place)
         db.refresh(db_node)
+        routing_graph.add_node(node_id, "place")
 
         # Return combined place info
         return {
@@ -517,30 +830,33 @@ def create_place(place: schema.PlaceCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/places", response_model=list[schema.Place])
-def read_places(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    places = (
-        db.query(models.Place, models.Node)
+@app.post("/places/bulk", response_model=schema.BulkCreateResult)
+def bulk_create_places(places: list[schema.PlaceCreate], db: Session = Depends(get_db)):
+    return _bulk_create_nodes(db, places, bulk.create_places, "place")
+
+
+def _read_places(db: Session, skip, limit, bbox):
+    query = (
+        db.query(*schema_columns(schema.Place, models.Place, models.Node))
+        .select_from(models.Place)
         .join(models.Node, models.Place.id == models.Node.id)
-        .offset(skip)
-        .limit(limit)
-        .all()
     )
-    return [
-        {
-            **place.__dict__,
-            "display_name": node.display_name,
-            "latitude": node.latitude,
-            "longitude": node.longitude,
-            "created_at": node.created_at,
-            "updated_at": node.updated_at,
-        }
-        for place, node in places
-    ]
+    if bbox is not None:
+        query = query.filter(_node_in_envelope(_bbox_envelope(bbox)))
+    return orjson_response(query.offset(skip).limit(limit).all())
 
 
-@app.get("/places/{place_id}", response_model=schema.Place)
-def read_place(place_id: UUID, db: Session = Depends(get_db)):
+@app.get("/places", response_model=list[schema.Place])
+async def read_places(
+    skip: int = 0,
+    limit: int = 100,
+    bbox: Optional[str] = BBOX_QUERY,
+    db=Depends(read_db),
+):
+    return await _run_db(db, _read_places, skip, limit, bbox)
+
+
+def _read_place(db: Session, place_id):
     result = (
         db.query(models.Place, models.Node)
         .join(models.Node, models.Place.id == models.Node.id)
@@ -560,10 +876,19 @@ def read_place(place_id: UUID, db: Session = Depends(get_db)):
     }
 
 
+@app.get("/places/{place_id}", response_model=schema.Place)
+async def read_place(place_id: UUID, db=Depends(read_db)):
+    return await _run_db(db, _read_place, place_id)
+
+
+def _closest_dam_id(db: Session, place_id):
+    return db.query(models.Place.closest_dam_id).filter(models.Place.id == place_id).first()
+
+
 @app.get("/places/{place_id}/route", response_model=schema.ShortestPathResponse)
-def get_route_to_closest_dam(place_id: UUID, db: Session = Depends(get_db)):
+async def get_route_to_closest_dam(place_id: UUID, db=Depends(read_db)):
     # Get the place and its closest dam
-    place = db.query(models.Place).filter(models.Place.id == place_id).first()
+    place = await _run_db(db, _closest_dam_id, place_id)
     if not place:
         raise HTTPException(status_code=404, detail="Place not found")
 
@@ -571,47 +896,62 @@ def get_route_to_closest_dam(place_id: UUID, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Place has no connected dam")
 
     # Get the path from place to its closest dam
-    return get_shortest_path(place_id, place.closest_dam_id, db)
+    return await get_shortest_path(place_id, place.closest_dam_id, db)
 
 
-@app.get("/points/{latitude}/{longitude}/route", response_model=schema.PointRouteResponse)
-def get_route_to_closest_dam_from_point(
-    latitude: float, longitude: float, db: Session = Depends(get_db)
-):
-    # Find the place that we're inside of (center and radius)
-    places = (
-        db.query(models.Place, models.Node)
-        .join(models.Node, models.Place.id == models.Node.id)
-        .all()
+def _place_at_point(db: Session, latitude, longitude):
+    """(place, node, inside_place) of the place a point falls in."""
+    # Nearest place whose radius contains the point, with the nearest place overall as a
+    # fallback. Both are GiST index scans on nodes.location.
+    point = cast(func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326), Geography)
+    distance = func.ST_Distance(models.Node.location, point)
+    places = db.query(models.Place, models.Node).join(
+        models.Node, models.Place.id == models.Node.id
     )
+    max_radius = db.query(func.max(models.Place.radius)).scalar_subquery()
 
-    point_location = (float(latitude), float(longitude))
-    containing_place = None
-    containing_place_node = None
+    inside_place = True
+    result = (
+        places.filter(func.ST_DWithin(models.Node.location, point, max_radius))
+        .filter(distance <= models.Place.radius)
+        .order_by(distance, models.Node.id)
+        .first()
+    )
+    if result is None:
+        inside_place = False
+        result = places.order_by(models.Node.location.op("<->")(point), models.Node.id).first()
 
-    for place, node in places:
-        place_location = (float(node.latitude), float(node.longitude))
-        # Calculate distance in meters
-        distance = (
-            calculate_spherical_distance(
-                point_location[0], point_location[1], place_location[0], place_location[1]
-            )
-            * 1000
-        )  # Convert km to meters
+    if result is None:
+        raise HTTPException(status_code=404, detail="No places found")
+
+    return (*result, inside_place)
 
-        if distance <= float(place.radius):
-            containing_place = place
-            containing_place_node = node
-            break
 
-    if not containing_place:
-        raise HTTPException(status_code=404, detail="Point is not inside any place")
+def _latest_measurements(db: Session, dam_ids):
+    """DamLatestMeasurement rows of the given dams, as primary key lookups."""
+    return {
+        latest.dam_id: latest
+        for latest in db.query(models.DamLatestMeasurement).filter(
+            models.DamLatestMeasurement.dam_id.in_(dam_ids)
+        )
+    }
+
+
+@app.get("/points/{latitude}/{longitude}/route", response_model=schema.PointRouteResponse)
+async def get_route_to_closest_dam_from_point(
+    latitude: float, longitude: float, db=Depends(read_db)
+):
+    containing_place, containing_place_node, inside_place = await _run_db(
+        db, _place_at_point, latitude, longitude
+    )
 
     if not containing_place.closest_dam_id:
         raise HTTPException(status_code=404, detail="Place has no connected dam")
 
     # Get the path from place to its closest dam
-    path_response = get_shortest_path(containing_place.id, containing_place.closest_dam_id, db)
+    path_response = await get_shortest_path(
+        containing_place.id, containing_place.closest_dam_id, db
+    )
 
     # Create a point node for the starting location
     point_node = schema.PointNode(
@@ -664,6 +1004,12 @@ def get_route_to_closest_dam_from_point(
     total_dam_outflow = 0  # m³/month
     total_natural_inflow = 0  # m³/month
 
+    # Latest fill state of every dam on the path, as primary key lookups
+    dam_ids = [
+        node["id"] for node in path_nodes if isinstance(node, dict) and node["node_type"] == "dam"
+    ]
+    latest_measurements = await _run_db(db, _latest_measurements, dam_ids)
+
     for node in path_nodes:
         if isinstance(node, dict):
             if node["node_type"] == "place":
@@ -678,18 +1024,12 @@ def get_route_to_closest_dam_from_point(
                 total_natural_inflow += daily_natural * 30
 
             elif node["node_type"] == "dam":
-                # Get latest measurement for this dam
-                latest_measurement = (
-                    db.query(models.DamBulletinMeasurement)
-                    .filter(models.DamBulletinMeasurement.dam_id == node["id"])
-                    .order_by(models.DamBulletinMeasurement.timestamp.desc())
-                    .first()
-                )
+                latest_measurement = latest_measurements.get(node["id"])
 
                 if latest_measurement:
                     # Add the measurement to the node for display
                     node["latest_measurement"] = {
-                        "id": latest_measurement.id,
+                        "id": latest_measurement.measurement_id,
                         "timestamp": latest_measurement.timestamp,
                         "volume": float(latest_measurement.volume),
                         "fill_volume": float(latest_measurement.fill_volume),
@@ -705,6 +1045,7 @@ def get_route_to_closest_dam_from_point(
         "path": path_nodes,
         "total_distance": current_distance,
         "place": place_info,
+        "inside_place": inside_place,
         "water_metrics": {
             "total_consumption": total_consumption,  # m³/month
             "total_dam_outflow": total_dam_outflow,  # m³/month
@@ -716,6 +1057,18 @@ def get_route_to_closest_dam_from_point(
     }
 
 
+@app.post("/places/closest-dams", response_model=schema.ClosestDamAssignmentResult)
+def assign_closest_dams(db: Session = Depends(get_db)):
+    try:
+        assigned, unreachable = routing.assign_closest_dams(db, routing_graph)
+        db.commit()
+        response_cache.invalidate("places")
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"assigned": assigned, "unreachable": unreachable}
+
+
 @app.patch("/places/{place_id}/closest-dam/{dam_id}", response_model=schema.Place)
 def update_place_closest_dam(place_id: UUID, dam_id: UUID, db: Session = Depends(get_db)):
     # Verify both place and dam exist
@@ -727,9 +1080,13 @@ def update_place_closest_dam(place_id: UUID, dam_id: UUID, db: Session = Depends
     if not dam:
         raise HTTPException(status_code=404, detail="Dam not found")
 
-    # Update the closest dam
+    # Update the closest dam; a manual assignment has no network distance, and is marked so
+    # that the automatic assignment leaves it alone
     place.closest_dam_id = dam_id
+    place.closest_dam_distance = None
+    place.closest_dam_manual = True
     db.commit()
+    response_cache.invalidate("places")
 
     # Return updated place with node info
     result = (
@@ -778,8 +1135,10 @@ def create_junction(junction: schema.JunctionCreate, db: Session = Depends(get_d
 
         # Commit both records in a single transaction
         db.commit()
+        response_cache.invalidate("junctions")
         db.refresh(db_junction)
         db.refresh(db_node)
+        routing_graph.add_node(node_id, "junction")
 
         # Return combined junction info
         return {
@@ -795,30 +1154,30 @@ def create_junction(junction: schema.JunctionCreate, db: Session = Depends(get_d
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/junctions/bulk", response_model=schema.BulkCreateResult)
+def bulk_create_junctions(junctions: list[schema.JunctionCreate], db: Session = Depends(get_db)):
+    return _bulk_create_nodes(db, junctions, bulk.create_junctions, "junction")
+
+
 @app.get("/junctions", response_model=list[schema.Junction])
-def read_junctions(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    junctions = (
-        db.query(models.Junction, models.Node)
+def read_junctions(
+    skip: int = 0,
+    limit: int = 100,
+    bbox: Optional[str] = BBOX_QUERY,
+    db: Session = Depends(get_read_db),
+):
+    query = (
+        db.query(*schema_columns(schema.Junction, models.Junction, models.Node))
+        .select_from(models.Junction)
         .join(models.Node, models.Junction.id == models.Node.id)
-        .offset(skip)
-        .limit(limit)
-        .all()
     )
-    return [
-        {
-            **junction.__dict__,
-            "display_name": node.display_name,
-            "latitude": node.latitude,
-            "longitude": node.longitude,
-            "created_at": node.created_at,
-            "updated_at": node.updated_at,
-        }
-        for junction, node in junctions
-    ]
+    if bbox is not None:
+        query = query.filter(_node_in_envelope(_bbox_envelope(bbox)))
+    return orjson_response(query.offset(skip).limit(limit).all())
 
 
 @app.get("/junctions/{junction_id}", response_model=schema.Junction)
-def read_junction(junction_id: UUID, db: Session = Depends(get_db)):
+def read_junction(junction_id: UUID, db: Session = Depends(get_read_db)):
     result = (
         db.query(models.Junction, models.Node)
         .join(models.Node, models.Junction.id == models.Node.id)
@@ -862,25 +1221,59 @@ def create_edge(edge: schema.EdgeCreate, db: Session = Depends(get_db)):
         db_edge = models.Edge(
             source_node_id=edge.source_node_id,
             target_node_id=edge.target_node_id,
+            source_routing_id=source_node.routing_id,
+            target_routing_id=target_node.routing_id,
             distance=distance_meters,
             description=edge.description,
         )
         db.add(db_edge)
         db.commit()
+        response_cache.invalidate("edges")
         db.refresh(db_edge)
+        routing_graph.add_edge(db_edge.source_node_id, db_edge.target_node_id, distance_meters)
+        if routing.update_closest_dams(
+            db, routing_graph, [(db_edge.source_node_id, db_edge.target_node_id, distance_meters)]
+        ):
+            db.commit()
+            response_cache.invalidate("places")
         return db_edge
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/edges/bulk", response_model=schema.BulkCreateResult)
+def bulk_create_edges(edges: list[schema.EdgeCreate], db: Session = Depends(get_db)):
+    """Create many edges in one transaction, with their distances computed together."""
+    if not edges:
+        return {"ids": []}
+    try:
+        created = bulk.create_edges(db, edges)
+        db.commit()
+        response_cache.invalidate("edges")
+        edge_ends = [edge[1:] for edge in created]
+        for source_id, target_id, distance in edge_ends:
+            routing_graph.add_edge(source_id, target_id, distance)
+        if routing.update_closest_dams(db, routing_graph, edge_ends):
+            db.commit()
+            response_cache.invalidate("places")
+        return {"ids": [edge_id for edge_id, *_ in created]}
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/edges", response_model=list[schema.Edge])
-def read_edges(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return db.query(models.Edge).offset(skip).limit(limit).all()
+def read_edges(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
+    query = db.query(*schema_columns(schema.Edge, models.Edge))
+    return orjson_response(query.offset(skip).limit(limit).all())
 
 
 @app.get("/edges/{edge_id}", response_model=schema.Edge)
-def read_edge(edge_id: UUID, db: Session = Depends(get_db)):
+def read_edge(edge_id: UUID, db: Session = Depends(get_read_db)):
     db_edge = db.query(models.Edge).filter(models.Edge.id == edge_id).first()
     if db_edge is None:
         raise HTTPException(status_code=404, detail="Edge not found")
@@ -889,23 +1282,86 @@ def read_edge(edge_id: UUID, db: Session = Depends(get_db)):
 
 # Dam Bulletin Measurement endpoints
 @app.get("/measurements", response_model=list[schema.DamBulletinMeasurement])
-def read_measurements(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return (
-        db.query(models.DamBulletinMeasurement)
-        .order_by(models.DamBulletinMeasurement.timestamp.asc())
-        .offset(skip)
-        .limit(limit)
-        .all()
-    )
+async def read_measurements(
+    skip: int = Query(0, deprecated=True, description="Use cursor instead"),
+    limit: int = 100,
+    from_: Optional[datetime] = FROM_QUERY,
+    to: Optional[datetime] = TO_QUERY,
+    cursor: Optional[str] = CURSOR_QUERY,
+    db=Depends(read_db),
+):
+    measurements = await _run_db(db, _measurement_page, None, from_, to, cursor, limit, skip)
+    response = orjson_response(measurements)
+    set_next_cursor(response, measurements, limit)
+    return response
 
 
-@app.get("/measurements/{measurement_id}", response_model=schema.DamBulletinMeasurement)
-def read_measurement(measurement_id: UUID, db: Session = Depends(get_db)):
-    db_measurement = (
+async def _raw_body(request: Request) -> bytes:
+    return await request.body()
+
+
+BULK_MEASUREMENT_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {
+                "schema": {
+                    "type": "array",
+                    "items": {"$ref": "#/components/schemas/DamBulletinMeasurementCreate"},
+                }
+            },
+            "application/x-ndjson": {"schema": {"type": "string"}},
+            "text/csv": {"schema": {"type": "string"}},
+        },
+    }
+}
+
+
+@app.post(
+    "/measurements/bulk",
+    response_model=schema.BulkMeasurementResult,
+    openapi_extra=BULK_MEASUREMENT_BODY,
+)
+def bulk_create_measurements(
+    body: bytes = Depends(_raw_body),
+    content_type: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
+    """
+    Insert or overwrite many measurements at once, e.g. a whole daily bulletin.
+
+    The body is a JSON array, NDJSON or CSV with a header row naming the
+    DamBulletinMeasurementCreate fields. Rows are merged on (dam_id, timestamp).
+    """
+    try:
+        measurements = parse_measurement_rows(body, content_type)
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=422, detail=e.errors(include_url=False, include_context=False)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    if not measurements:
+        return {"received": 0, "inserted": 0, "updated": 0}
+
+    inserted, updated = bulk_upsert_measurements(db, measurements)
+    db.commit()
+    response_cache.invalidate("measurements")
+    return {"received": len(measurements), "inserted": inserted, "updated": updated}
+
+
+def _get_measurement(db: Session, measurement_id):
+    return (
         db.query(models.DamBulletinMeasurement)
         .filter(models.DamBulletinMeasurement.id == measurement_id)
         .first()
     )
+
+
+@app.get("/measurements/{measurement_id}", response_model=schema.DamBulletinMeasurement)
+async def read_measurement(measurement_id: UUID, db=Depends(read_db)):
+    db_measurement = await _run_db(db, _get_measurement, measurement_id)
     if db_measurement is None:
         raise HTTPException(status_code=404, detail="Measurement not found")
     return db_measurement
@@ -916,81 +1372,113 @@ def read_measurement(measurement_id: UUID, db: Session = Depends(get_db)):
 def create_dam_prediction(
     dam_id: UUID, prediction: schema.DamPredictionCreate, db: Session = Depends(get_db)
 ):
-    # Get the dam's max volume first
-    dam = db.query(models.Dam).filter(models.Dam.id == prediction.dam_id).first()
-    if not dam:
+    if not db.query(models.Dam.id).filter(models.Dam.id == prediction.dam_id).first():
         raise HTTPException(status_code=404, detail="Dam not found")
 
-    db_prediction = models.DamPrediction(**prediction.model_dump())
-    db.add(db_prediction)
+    prediction_id = uuid.uuid4()
+    db.add(models.DamPrediction(id=prediction_id, **prediction.model_dump()))
     db.commit()
-    db.refresh(db_prediction)
 
-    # Calculate fill percentage
-    db_prediction.fill_percentage = (db_prediction.fill_volume / dam.max_volume) * 100
+    # Read back with the fill percentage, which is null for a dam without a max volume
+    return _prediction_query(db).filter(models.DamPrediction.id == prediction_id).one()._asdict()
 
-    return db_prediction
+
+def _prediction_query(db: Session):
+    """DamPrediction rows with fill_percentage computed in SQL from the dam's max volume."""
+    fill_percentage = (
+        cast(models.DamPrediction.fill_volume, Float)
+        / func.nullif(cast(models.Dam.max_volume, Float), 0)
+        * 100
+    )
+    return (
+        db.query(
+            *schema_columns(schema.DamPrediction, models.DamPrediction),
+            fill_percentage.label("fill_percentage"),
+        )
+        .select_from(models.DamPrediction)
+        .join(models.Dam, models.DamPrediction.dam_id == models.Dam.id)
+    )
 
 
 @app.get("/dams/{dam_id}/predictions", response_model=list[schema.DamPrediction])
-def get_dam_predictions(dam_id: UUID, db: Session = Depends(get_db)):
-    # Get the dam's max volume first
-    dam = db.query(models.Dam).filter(models.Dam.id == dam_id).first()
-    if not dam:
+def get_dam_predictions(
+    dam_id: UUID,
+    from_: Optional[datetime] = FROM_QUERY,
+    to: Optional[datetime] = TO_QUERY,
+    cursor: Optional[str] = CURSOR_QUERY,
+    limit: Optional[int] = Query(None, ge=1, description="Page size, unbounded by default"),
+    db: Session = Depends(get_read_db),
+):
+    """
+    A dam's predictions, a cursor page at a time.
+
+    Aggregates per day, week or month are served by /dams/{dam_id}/predictions/series, as
+    buckets have a schema of their own and are not paged.
+    """
+    if not db.query(models.Dam.id).filter(models.Dam.id == dam_id).first():
         raise HTTPException(status_code=404, detail="Dam not found")
 
-    # Get predictions and calculate percentages
-    predictions = (
-        db.query(models.DamPrediction)
-        .filter(models.DamPrediction.dam_id == dam_id)
-        .order_by(models.DamPrediction.timestamp.asc())
-        .all()
-    )
+    query = _prediction_query(db).filter(models.DamPrediction.dam_id == dam_id)
+    predictions = time_range_page(query, models.DamPrediction, from_, to, cursor, limit).all()
 
-    for prediction in predictions:
-        prediction.fill_percentage = (prediction.fill_volume / dam.max_volume) * 100
+    response = orjson_response(predictions)
+    set_next_cursor(response, predictions, limit)
+    return response
 
-    return predictions
+
+@app.get("/dams/{dam_id}/predictions/series", response_model=list[schema.DamPredictionBucket])
+def get_dam_prediction_series(
+    dam_id: UUID,
+    resolution: Literal["day", "week", "month"] = RESOLUTION_QUERY,
+    from_: Optional[datetime] = FROM_QUERY,
+    to: Optional[datetime] = TO_QUERY,
+    max_points: Optional[int] = MAX_POINTS_QUERY,
+    db: Session = Depends(get_read_db),
+):
+    """Predictions aggregated per bucket in the database, for charts over long ranges."""
+    dam = db.query(models.Dam.max_volume).filter(models.Dam.id == dam_id).first()
+    if not dam:
+        raise HTTPException(status_code=404, detail="Dam not found")
+    # Like _prediction_query, there is no percentage of an unknown or zero max volume
+    max_volume = float(dam.max_volume) if dam.max_volume else None
+
+    buckets = time_series(
+        db, models.DamPrediction, PREDICTION_SERIES_COLUMNS, dam_id, resolution, from_, to
+    )
+    # The percentage is linear in fill_volume, so its stats scale the same way
+    for bucket in buckets:
+        bucket["fill_percentage"] = {
+            stat: (value / max_volume) * 100 if value is not None and max_volume else None
+            for stat, value in bucket["fill_volume"].items()
+        }
+    return downsample_series(buckets, max_points)
 
 
 @app.get("/predictions", response_model=list[schema.DamPrediction])
-def read_predictions(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    # Get predictions with their corresponding dams
+def read_predictions(
+    skip: int = Query(0, deprecated=True, description="Use cursor instead"),
+    limit: int = 100,
+    from_: Optional[datetime] = FROM_QUERY,
+    to: Optional[datetime] = TO_QUERY,
+    cursor: Optional[str] = CURSOR_QUERY,
+    db: Session = Depends(get_read_db),
+):
     predictions = (
-        db.query(models.DamPrediction, models.Dam)
-        .join(models.Dam, models.DamPrediction.dam_id == models.Dam.id)
-        .order_by(models.DamPrediction.timestamp.asc())
+        time_range_page(_prediction_query(db), models.DamPrediction, from_, to, cursor, limit)
         .offset(skip)
-        .limit(limit)
         .all()
     )
-
-    # Calculate fill percentages
-    result = []
-    for prediction, dam in predictions:
-        prediction.fill_percentage = (prediction.fill_volume / dam.max_volume) * 100
-        result.append(prediction)
-
-    return result
+    response = orjson_response(predictions)
+    set_next_cursor(response, predictions, limit)
+    return response
 
 
 @app.get("/predictions/{prediction_id}", response_model=schema.DamPrediction)
-def read_prediction(prediction_id: UUID, db: Session = Depends(get_db)):
-    # Get prediction with its dam
-    result = (
-        db.query(models.DamPrediction, models.Dam)
-        .join(models.Dam, models.DamPrediction.dam_id == models.Dam.id)
-        .filter(models.DamPrediction.id == prediction_id)
-        .first()
-    )
-
-    if not result:
+def read_prediction(prediction_id: UUID, db: Session = Depends(get_read_db)):
+    prediction = _prediction_query(db).filter(models.DamPrediction.id == prediction_id).first()
+    if not prediction:
         raise HTTPException(status_code=404, detail="Prediction not found")
-
-    prediction, dam = result
-    prediction.fill_percentage = (prediction.fill_volume / dam.max_volume) * 100
-
-    return prediction
+    return prediction._asdict()
 
 
 # Satellite Image endpoints
@@ -1004,7 +1492,7 @@ def create_satellite_image(image: schema.SatelliteImageCreate, db: Session = Dep
 
 
 @app.get("/satellite-images", response_model=list[schema.SatelliteImage])
-def read_satellite_images(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_satellite_images(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     return db.query(models.SatelliteImage).offset(skip).limit(limit).all()
 
 
@@ -1019,7 +1507,7 @@ def create_bill_form(form: schema.UserBillFormCreate, db: Session = Depends(get_
 
 
 @app.get("/bill-forms", response_model=list[schema.UserBillForm])
-def read_bill_forms(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_bill_forms(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     return db.query(models.UserBillForm).offset(skip).limit(limit).all()
 
 
@@ -1036,7 +1524,7 @@ def create_subscription(
 
 
 @app.get("/newsletter", response_model=list[schema.NewsletterSubscription])
-def read_subscriptions(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_subscriptions(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     return db.query(models.NewsletterSubscription).offset(skip).limit(limit).all()
 
 
@@ -1051,12 +1539,12 @@ def create_alert(alert: schema.DamAlertCreate, db: Session = Depends(get_db)):
 
 
 @app.get("/alerts", response_model=list[schema.DamAlert])
-def read_alerts(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_alerts(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     return db.query(models.DamAlert).offset(skip).limit(limit).all()
 
 
 @app.get("/alerts/{alert_id}", response_model=schema.DamAlert)
-def read_alert(alert_id: UUID, db: Session = Depends(get_db)):
+def read_alert(alert_id: UUID, db: Session = Depends(get_read_db)):
     db_alert = db.query(models.DamAlert).filter(models.DamAlert.id == alert_id).first()
     if db_alert is None:
         raise HTTPException(status_code=404, detail="Alert not found")
@@ -0,0 +1,435 @@
+import csv
+import io
+import json
+from datetime import datetime, time, timezone
+
+from fastapi import HTTPException
+from pydantic import TypeAdapter
+from sqlalchemy import Float, cast, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import text
+
+from . import models, schema
+from .utils import largest_triangle_three_buckets
+
+LATEST_COLUMNS = ("timestamp", "volume", "fill_volume", "avg_incoming_flow", "avg_outgoing_flow")
+
+# Column order of the staging table and of CSV bodies sent to the bulk endpoint
+BULK_COLUMNS = ("dam_id", *LATEST_COLUMNS)
+
+_measurement_list = TypeAdapter(list[schema.DamBulletinMeasurementCreate])
+
+# Bucket widths accepted by the series endpoints, as date_trunc field names
+SERIES_RESOLUTIONS = ("day", "week", "month")
+MEASUREMENT_SERIES_COLUMNS = ("volume", "fill_volume", "avg_incoming_flow", "avg_outgoing_flow")
+PREDICTION_SERIES_COLUMNS = ("fill_volume",)
+
+# Resolutions kept precomputed in dam_measurement_rollups
+ROLLUP_RESOLUTIONS = ("week", "month")
+ROLLUP_STATS = ("mean", "min", "max")
+
+# Years after the current one that ensure_measurement_partitions prepares partitions for
+MEASUREMENT_PARTITION_YEARS_AHEAD = 1
+MEASUREMENT_PARTITION_DEFAULT = "dam_bulletin_measurements_default"
+
+
+def record_latest_measurement(db, measurement):
+    """Make a newly written measurement its dam's latest one, unless a newer one exists."""
+    values = {column: getattr(measurement, column) for column in LATEST_COLUMNS}
+    stmt = insert(models.DamLatestMeasurement).values(
+        dam_id=measurement.dam_id, measurement_id=measurement.id, **values
+    )
+    set_ = {column: stmt.excluded[column] for column in LATEST_COLUMNS}
+    set_["measurement_id"] = stmt.excluded.measurement_id
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.DamLatestMeasurement.dam_id],
+        set_=set_,
+        # Backfilled older bulletins must not replace a newer latest measurement
+        where=models.DamLatestMeasurement.timestamp <= stmt.excluded.timestamp,
+    )
+    db.execute(stmt)
+
+
+def refresh_latest_measurements(db, dam_ids):
+    """Recompute the latest measurement of the given dams from the measurements table."""
+    db.execute(
+        text(
+            """
+            INSERT INTO false_positive.dam_latest_measurements (
+                dam_id, measurement_id, timestamp, volume, fill_volume,
+                avg_incoming_flow, avg_outgoing_flow
+            )
+            SELECT DISTINCT ON (dam_id)
+                dam_id, id, timestamp, volume, fill_volume, avg_incoming_flow, avg_outgoing_flow
+            FROM false_positive.dam_bulletin_measurements
+            WHERE dam_id = ANY(CAST(:dam_ids AS uuid[]))
+            ORDER BY dam_id, timestamp DESC
+            ON CONFLICT (dam_id) DO UPDATE SET
+                measurement_id = excluded.measurement_id,
+                timestamp = excluded.timestamp,
+                volume = excluded.volume,
+                fill_volume = excluded.fill_volume,
+                avg_incoming_flow = excluded.avg_incoming_flow,
+                avg_outgoing_flow = excluded.avg_outgoing_flow
+            """
+        ),
+        {"dam_ids": [str(dam_id) for dam_id in dam_ids]},
+    )
+
+
+def ensure_measurement_partitions(
+    db, first_year=None, years_ahead=MEASUREMENT_PARTITION_YEARS_AHEAD
+):
+    """
+    Create the missing yearly partitions of dam_bulletin_measurements, and its default one.
+
+    Covers first_year (the current year by default) to years_ahead years from now. Rows that
+    landed in the default partition for a year are moved into the new partition. Returns the
+    names of the created partitions; the caller commits.
+    """
+    # Workers starting together would otherwise race to create the same partitions
+    db.execute(text("SELECT pg_advisory_xact_lock(hashtext('dam_bulletin_measurements'))"))
+    existing = set(
+        db.execute(
+            text(
+                """
+                SELECT c.relname
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = 'false_positive.dam_bulletin_measurements'::regclass
+                """
+            )
+        ).scalars()
+    )
+
+    created = []
+    if MEASUREMENT_PARTITION_DEFAULT not in existing:
+        db.execute(
+            text(
+                f"CREATE TABLE false_positive.{MEASUREMENT_PARTITION_DEFAULT} "
+                "PARTITION OF false_positive.dam_bulletin_measurements DEFAULT"
+            )
+        )
+        created.append(MEASUREMENT_PARTITION_DEFAULT)
+
+    this_year = datetime.now(timezone.utc).year
+    for year in range(min(first_year or this_year, this_year), this_year + years_ahead + 1):
+        partition = f"dam_bulletin_measurements_y{year}"
+        if partition in existing:
+            continue
+        start = datetime(year, 1, 1, tzinfo=timezone.utc)
+        end = datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+        # Attaching fails while the default partition holds rows of the new range, so the
+        # partition is filled with them before it is attached
+        db.execute(
+            text(
+                f"CREATE TABLE false_positive.{partition} "
+                "(LIKE false_positive.dam_bulletin_measurements INCLUDING DEFAULTS)"
+            )
+        )
+        db.execute(
+            text(
+                f"""
+                WITH moved AS (
+                    DELETE FROM false_positive.{MEASUREMENT_PARTITION_DEFAULT}
+                    WHERE timestamp >= :start AND timestamp < :end
+                    RETURNING *
+                )
+                INSERT INTO false_positive.{partition} SELECT * FROM moved
+                """
+            ),
+            {"start": start, "end": end},
+        )
+        db.execute(
+            text(
+                "ALTER TABLE false_positive.dam_bulletin_measurements "
+                f"ATTACH PARTITION false_positive.{partition} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+        )
+        created.append(partition)
+    return created
+
+
+def time_series(db, model, columns, dam_id, resolution, from_=None, to=None):
+    """
+    Aggregate a dam's rows of model into UTC date_trunc(resolution) buckets.
+
+    Returns one dict per bucket, oldest first, with bucket_start, count and a
+    {"mean", "min", "max"} dict for each of columns.
+    """
+    # UTC buckets, whatever the session time zone, the same as dam_measurement_rollups
+    bucket = func.date_trunc(resolution, model.timestamp, "UTC")
+    aggregates = []
+    for column in columns:
+        attr = getattr(model, column)
+        aggregates += [
+            cast(func.avg(attr), Float),
+            cast(func.min(attr), Float),
+            cast(func.max(attr), Float),
+        ]
+
+    query = db.query(bucket, func.count(), *aggregates).filter(model.dam_id == dam_id)
+    if from_ is not None:
+        query = query.filter(model.timestamp >= from_)
+    if to is not None:
+        query = query.filter(model.timestamp < to)
+
+    buckets = []
+    for bucket_start, count, *values in query.group_by(bucket).order_by(bucket):
+        row = {"bucket_start": bucket_start, "count": count}
+        for i, column in enumerate(columns):
+            mean, min_, max_ = values[3 * i : 3 * i + 3]
+            row[column] = {"mean": mean, "min": min_, "max": max_}
+        buckets.append(row)
+    return buckets
+
+
+def _rollup_aligned(resolution, moment):
+    """Whether moment is None or the UTC start of a week/month bucket."""
+    if moment is None:
+        return True
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    moment = moment.astimezone(timezone.utc)
+    if moment.timetz() != time(tzinfo=timezone.utc):
+        return False
+    return moment.weekday() == 0 if resolution == "week" else moment.day == 1
+
+
+def measurement_series(db, dam_id, resolution, from_=None, to=None):
+    """
+    time_series of a dam's measurements, read from dam_measurement_rollups when it can be.
+
+    The rollups hold whole buckets only, so they answer week and month series whose from_
+    and to fall on bucket boundaries; any other range is aggregated from the raw rows.
+    """
+    if not (
+        resolution in ROLLUP_RESOLUTIONS
+        and _rollup_aligned(resolution, from_)
+        and _rollup_aligned(resolution, to)
+    ):
+        return time_series(
+            db,
+            models.DamBulletinMeasurement,
+            MEASUREMENT_SERIES_COLUMNS,
+            dam_id,
+            resolution,
+            from_,
+            to,
+        )
+
+    rollup = models.DamMeasurementRollup
+    query = db.query(rollup).filter(rollup.dam_id == dam_id, rollup.resolution == resolution)
+    if from_ is not None:
+        query = query.filter(rollup.bucket_start >= from_)
+    if to is not None:
+        query = query.filter(rollup.bucket_start < to)
+
+    buckets = []
+    for row in query.order_by(rollup.bucket_start):
+        bucket = {"bucket_start": row.bucket_start, "count": row.count}
+        for column in MEASUREMENT_SERIES_COLUMNS:
+            bucket[column] = {stat: getattr(row, f"{column}_{stat}") for stat in ROLLUP_STATS}
+        buckets.append(bucket)
+    return buckets
+
+
+def _rollup_sql(touched_sql):
+    """Upsert of the rollups of the (dam_id, resolution, bucket_start) rows of touched_sql."""
+    value_columns = [
+        f"{column}_{stat}" for column in MEASUREMENT_SERIES_COLUMNS for stat in ROLLUP_STATS
+    ]
+    aggregates = [
+        f"{function}(m.{column})::float8"
+        for column in MEASUREMENT_SERIES_COLUMNS
+        for function in ("avg", "min", "max")
+    ]
+    return f"""
+        WITH touched AS ({touched_sql})
+        INSERT INTO false_positive.dam_measurement_rollups (
+            dam_id, resolution, bucket_start, count, {", ".join(value_columns)}
+        )
+        SELECT t.dam_id, t.resolution, t.bucket_start, count(*), {", ".join(aggregates)}
+        FROM touched t
+        JOIN false_positive.dam_bulletin_measurements m
+            ON m.dam_id = t.dam_id
+            AND m.timestamp >= t.bucket_start
+            -- Month lengths in UTC, not in the session time zone
+            AND m.timestamp < (
+                (t.bucket_start AT TIME ZONE 'UTC') + CAST('1 ' || t.resolution AS interval)
+            ) AT TIME ZONE 'UTC'
+        GROUP BY t.dam_id, t.resolution, t.bucket_start
+        ON CONFLICT (dam_id, resolution, bucket_start) DO UPDATE SET
+            count = excluded.count,
+            {", ".join(f"{column} = excluded.{column}" for column in value_columns)}
+    """
+
+
+def refresh_measurement_rollups(db, measurements):
+    """
+    Recompute the week and month rollups containing the given (dam_id, timestamp) pairs.
+
+    Each touched bucket is aggregated again from its measurements, which an index range scan
+    finds, so overwritten measurements are accounted for as well as new ones.
+    """
+    if not measurements:
+        return
+    dam_ids, timestamps = zip(*measurements)
+    db.execute(
+        text(
+            _rollup_sql(
+                """
+                SELECT DISTINCT
+                    w.dam_id, r.resolution, date_trunc(r.resolution, w.timestamp, 'UTC')
+                        AS bucket_start
+                FROM unnest(CAST(:dam_ids AS uuid[]), CAST(:timestamps AS timestamptz[]))
+                    AS w (dam_id, timestamp)
+                CROSS JOIN unnest(CAST(:resolutions AS text[])) AS r (resolution)
+                """
+            )
+        ),
+        {
+            "dam_ids": [str(dam_id) for dam_id in dam_ids],
+            "timestamps": list(timestamps),
+            "resolutions": list(ROLLUP_RESOLUTIONS),
+        },
+    )
+
+
+def rebuild_measurement_rollups(db):
+    """Recompute every rollup, e.g. after measurements were COPYed in; the caller commits."""
+    db.execute(text("TRUNCATE false_positive.dam_measurement_rollups"))
+    db.execute(
+        text(
+            _rollup_sql(
+                """
+                SELECT DISTINCT
+                    m.dam_id, r.resolution, date_trunc(r.resolution, m.timestamp, 'UTC')
+                        AS bucket_start
+                FROM false_positive.dam_bulletin_measurements m
+                CROSS JOIN unnest(CAST(:resolutions AS text[])) AS r (resolution)
+                """
+            )
+        ),
+        {"resolutions": list(ROLLUP_RESOLUTIONS)},
+    )
+
+
+def downsample_series(buckets, max_points, column="fill_volume"):
+    """Reduce buckets to at most max_points with LTTB over the mean of column."""
+    if max_points is None or len(buckets) <= max_points:
+        return buckets
+    points = [
+        (bucket["bucket_start"].timestamp(), bucket[column]["mean"] or 0.0) for bucket in buckets
+    ]
+    return [buckets[i] for i in largest_triangle_three_buckets(points, max_points)]
+
+
+def parse_measurement_rows(body, content_type):
+    """
+    Validate a bulk body into DamBulletinMeasurementCreate rows.
+
+    Accepts a JSON array, NDJSON (application/x-ndjson) or CSV with a header row (text/csv).
+    Raises pydantic.ValidationError or ValueError on malformed input.
+    """
+    media_type = (content_type or "application/json").split(";")[0].strip().lower()
+    if media_type in ("application/x-ndjson", "application/jsonl", "application/ndjson"):
+        lines = body.decode("utf-8").splitlines()
+        return _measurement_list.validate_python(
+            [json.loads(line) for line in lines if line.strip()]
+        )
+    if media_type == "text/csv":
+        reader = csv.DictReader(io.StringIO(body.decode("utf-8-sig")))
+        missing = set(BULK_COLUMNS) - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"CSV header is missing {', '.join(sorted(missing))}")
+        return _measurement_list.validate_python(list(reader))
+    return _measurement_list.validate_json(body)
+
+
+def bulk_upsert_measurements(db, measurements):
+    """
+    COPY measurements into a staging table and merge them on (dam_id, timestamp).
+
+    Rows repeated within the batch are collapsed, the last one winning. Returns the
+    (inserted, updated) counts; the caller commits.
+    """
+    db.execute(
+        text(
+            """
+            CREATE TEMP TABLE measurement_staging (
+                seq integer NOT NULL,
+                dam_id uuid NOT NULL,
+                timestamp timestamptz NOT NULL,
+                volume numeric,
+                fill_volume numeric,
+                avg_incoming_flow numeric,
+                avg_outgoing_flow numeric
+            ) ON COMMIT DROP
+            """
+        )
+    )
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for seq, measurement in enumerate(measurements):
+        writer.writerow([seq, *(getattr(measurement, column) for column in BULK_COLUMNS)])
+    buffer.seek(0)
+    with db.connection().connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY measurement_staging (seq, {', '.join(BULK_COLUMNS)}) FROM STDIN WITH CSV",
+            buffer,
+        )
+
+    unknown = db.execute(
+        text(
+            """
+            SELECT DISTINCT s.dam_id
+            FROM measurement_staging s
+            LEFT JOIN false_positive.dams d ON d.id = s.dam_id
+            WHERE d.id IS NULL
+            """
+        )
+    ).scalars().all()
+    if unknown:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown dam ids: {', '.join(str(dam_id) for dam_id in unknown)}",
+        )
+
+    inserted, updated, dam_ids = db.execute(
+        text(
+            """
+            WITH merged AS (
+                INSERT INTO false_positive.dam_bulletin_measurements (
+                    id, dam_id, timestamp, volume, fill_volume,
+                    avg_incoming_flow, avg_outgoing_flow
+                )
+                SELECT DISTINCT ON (dam_id, timestamp)
+                    gen_random_uuid(), dam_id, timestamp, volume, fill_volume,
+                    avg_incoming_flow, avg_outgoing_flow
+                FROM measurement_staging
+                ORDER BY dam_id, timestamp, seq DESC
+                ON CONFLICT (dam_id, timestamp) DO UPDATE SET
+                    volume = excluded.volume,
+                    fill_volume = excluded.fill_volume,
+                    avg_incoming_flow = excluded.avg_incoming_flow,
+                    avg_outgoing_flow = excluded.avg_outgoing_flow
+                RETURNING dam_id, xmax = 0 AS inserted
+            )
+            SELECT
+                count(*) FILTER (WHERE inserted),
+                count(*) FILTER (WHERE NOT inserted),
+                array_agg(DISTINCT dam_id)
+            FROM merged
+            """
+        )
+    ).one()
+
+    if dam_ids:
+        refresh_latest_measurements(db, dam_ids)
+        refresh_measurement_rollups(
+            db, [(measurement.dam_id, measurement.timestamp) for measurement in measurements]
+        )
+    return inserted, updated
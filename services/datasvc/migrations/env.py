@@ -3,18 +3,18 @@ import os
 import sys
 from dotenv import load_dotenv
 
-# Add the parent directory to sys.path
+# Add the directory containing the datasvc package to sys.path
 current_dir = os.path.dirname(os.path.abspath(__file__))
-parent_dir = os.path.dirname(current_dir)
-sys.path.append(parent_dir)
+services_dir = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(services_dir)
 
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
 
 from alembic import context
 
-from database import Base
-from models import *
+from datasvc.database import Base
+from datasvc.models import *
 
 load_dotenv()
 
@@ -0,0 +1,48 @@
+"""add_dam_measurement_rollups
+
+Revision ID: 037893775704
+Revises: 7feed67cd210
+Create Date: 2025-03-18 09:42:17.615204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '037893775704'
+down_revision: Union[str, None] = '7feed67cd210'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SERIES_COLUMNS = ('volume', 'fill_volume', 'avg_incoming_flow', 'avg_outgoing_flow')
+
+
+def upgrade() -> None:
+    op.create_table('dam_measurement_rollups',
+    sa.Column('dam_id', sa.UUID(), nullable=False),
+    sa.Column('resolution', sa.String(), nullable=False),
+    sa.Column('bucket_start', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    *[sa.Column(f'{column}_{stat}', sa.Float(), nullable=True) for column in SERIES_COLUMNS for stat in ('mean', 'min', 'max')],
+    sa.ForeignKeyConstraint(['dam_id'], ['false_positive.dams.id'], ),
+    sa.PrimaryKeyConstraint('dam_id', 'resolution', 'bucket_start'),
+    schema='false_positive'
+    )
+
+    # Backfill from the existing bulletins; from here on the service keeps the rollups current
+    value_columns = ', '.join(f'{column}_{stat}' for column in SERIES_COLUMNS for stat in ('mean', 'min', 'max'))
+    aggregates = ', '.join(f'{function}({column})::float8' for column in SERIES_COLUMNS for function in ('avg', 'min', 'max'))
+    op.execute(f"""
+        INSERT INTO false_positive.dam_measurement_rollups (dam_id, resolution, bucket_start, count, {value_columns})
+        SELECT dam_id, r.resolution, date_trunc(r.resolution, timestamp, 'UTC'), count(*), {aggregates}
+        FROM false_positive.dam_bulletin_measurements
+        CROSS JOIN unnest(ARRAY['week', 'month']) AS r (resolution)
+        GROUP BY dam_id, r.resolution, date_trunc(r.resolution, timestamp, 'UTC')
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('dam_measurement_rollups', schema='false_positive')
@@ -0,0 +1,35 @@
+"""add_time_series_indexes
+
+Revision ID: 1ba57153e16f
+Revises: d64b31c9b9c5
+Create Date: 2025-03-10 09:34:18.552940
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1ba57153e16f'
+down_revision: Union[str, None] = 'd64b31c9b9c5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Per-dam history with from/to filters and (timestamp, id) keyset pagination
+    op.create_index('ix_dam_bulletin_measurements_dam_id_timestamp', 'dam_bulletin_measurements', ['dam_id', 'timestamp', 'id'], schema='false_positive')
+    op.create_index('ix_dam_predictions_dam_id_timestamp', 'dam_predictions', ['dam_id', 'timestamp', 'id'], schema='false_positive')
+
+    # Keyset pagination over all dams
+    op.create_index('ix_dam_bulletin_measurements_timestamp_id', 'dam_bulletin_measurements', ['timestamp', 'id'], schema='false_positive')
+    op.create_index('ix_dam_predictions_timestamp_id', 'dam_predictions', ['timestamp', 'id'], schema='false_positive')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_dam_predictions_timestamp_id', table_name='dam_predictions', schema='false_positive')
+    op.drop_index('ix_dam_bulletin_measurements_timestamp_id', table_name='dam_bulletin_measurements', schema='false_positive')
+    op.drop_index('ix_dam_predictions_dam_id_timestamp', table_name='dam_predictions', schema='false_positive')
+    op.drop_index('ix_dam_bulletin_measurements_dam_id_timestamp', table_name='dam_bulletin_measurements', schema='false_positive')
@@ -0,0 +1,49 @@
+"""add_dam_geometry_lods
+
+Revision ID: 2df36ff4d60e
+Revises: a1c08b2affff
+Create Date: 2025-03-08 13:50:26.183774
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2df36ff4d60e'
+down_revision: Union[str, None] = 'a1c08b2affff'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('dam_geometry_lods',
+        sa.Column('dam_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('level', sa.SmallInteger(), nullable=False),
+        sa.Column('geometry_json', sa.Text(), nullable=False),
+        sa.ForeignKeyConstraint(['dam_id'], ['false_positive.dams.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('dam_id', 'level'),
+        schema='false_positive'
+    )
+
+    # Same levels as geometry.GEOMETRY_LODS at the time of writing
+    op.execute("""
+        INSERT INTO false_positive.dam_geometry_lods (dam_id, level, geometry_json)
+        SELECT
+            d.id,
+            lod.level,
+            ST_AsGeoJSON(
+                ST_SimplifyPreserveTopology(ST_GeomFromGeoJSON(d.border_geometry_json), lod.tolerance),
+                lod.precision
+            )
+        FROM false_positive.dams d
+        CROSS JOIN (VALUES (1, 0.0001, 5), (2, 0.001, 4), (3, 0.01, 3)) AS lod(level, tolerance, precision)
+        WHERE d.border_geometry_json IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('dam_geometry_lods', schema='false_positive')
@@ -0,0 +1,27 @@
+"""add_closest_dam_manual_to_places
+
+Revision ID: 46702000676a
+Revises: af6bb26a34c3
+Create Date: 2025-03-20 11:18:53.126470
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '46702000676a'
+down_revision: Union[str, None] = 'af6bb26a34c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Marks closest dams set by hand, which the automatic assignment must not overwrite
+    op.add_column('places', sa.Column('closest_dam_manual', sa.Boolean(), server_default=sa.text('false'), nullable=False), schema='false_positive')
+
+
+def downgrade() -> None:
+    op.drop_column('places', 'closest_dam_manual', schema='false_positive')
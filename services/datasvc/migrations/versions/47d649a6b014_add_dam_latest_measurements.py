@@ -0,0 +1,50 @@
+"""add_dam_latest_measurements
+
+Revision ID: 47d649a6b014
+Revises: eefaaf8f655b
+Create Date: 2025-03-06 11:03:37.640298
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '47d649a6b014'
+down_revision: Union[str, None] = 'eefaaf8f655b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('dam_latest_measurements',
+        sa.Column('dam_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('measurement_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('timestamp', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('volume', sa.Numeric(), nullable=True),
+        sa.Column('fill_volume', sa.Numeric(), nullable=True),
+        sa.Column('avg_incoming_flow', sa.Numeric(), nullable=True),
+        sa.Column('avg_outgoing_flow', sa.Numeric(), nullable=True),
+        sa.ForeignKeyConstraint(['dam_id'], ['false_positive.dams.id'], ),
+        sa.PrimaryKeyConstraint('dam_id'),
+        schema='false_positive'
+    )
+
+    # Backfill with the newest measurement of every dam
+    op.execute("""
+        INSERT INTO false_positive.dam_latest_measurements (
+            dam_id, measurement_id, timestamp, volume, fill_volume,
+            avg_incoming_flow, avg_outgoing_flow
+        )
+        SELECT DISTINCT ON (dam_id)
+            dam_id, id, timestamp, volume, fill_volume, avg_incoming_flow, avg_outgoing_flow
+        FROM false_positive.dam_bulletin_measurements
+        ORDER BY dam_id, timestamp DESC
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('dam_latest_measurements', schema='false_positive')
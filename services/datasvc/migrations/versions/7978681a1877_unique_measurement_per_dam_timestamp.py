@@ -0,0 +1,45 @@
+"""unique_measurement_per_dam_timestamp
+
+Revision ID: 7978681a1877
+Revises: 1ba57153e16f
+Create Date: 2025-03-11 16:05:47.213894
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7978681a1877'
+down_revision: Union[str, None] = '1ba57153e16f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # A bulletin reports each dam once per timestamp; drop repeated rows before enforcing it
+    op.execute("""
+        DELETE FROM false_positive.dam_bulletin_measurements m
+        USING false_positive.dam_bulletin_measurements other
+        WHERE m.dam_id = other.dam_id
+        AND m.timestamp = other.timestamp
+        AND m.id < other.id
+    """)
+
+    # The latest copy may have pointed at one of the deleted duplicates
+    op.execute("""
+        UPDATE false_positive.dam_latest_measurements l
+        SET measurement_id = m.id
+        FROM false_positive.dam_bulletin_measurements m
+        WHERE m.dam_id = l.dam_id
+        AND m.timestamp = l.timestamp
+    """)
+
+    # Conflict target of the bulk ingest upsert
+    op.create_unique_constraint('uq_dam_bulletin_measurements_dam_id_timestamp', 'dam_bulletin_measurements', ['dam_id', 'timestamp'], schema='false_positive')
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_dam_bulletin_measurements_dam_id_timestamp', 'dam_bulletin_measurements', schema='false_positive', type_='unique')
@@ -0,0 +1,68 @@
+"""add_routing_ids
+
+Revision ID: 7fd364adc6ab
+Revises: 0329b7a46af3
+Create Date: 2025-03-02 14:12:40.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7fd364adc6ab'
+down_revision: Union[str, None] = '0329b7a46af3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Persistent integer ids for pgRouting; bigserial numbers the existing rows as well
+    op.execute('ALTER TABLE false_positive.nodes ADD COLUMN routing_id bigserial NOT NULL')
+    op.create_unique_constraint('uq_nodes_routing_id', 'nodes', ['routing_id'], schema='false_positive')
+
+    op.execute('ALTER TABLE false_positive.edges ADD COLUMN routing_id bigserial NOT NULL')
+    op.create_unique_constraint('uq_edges_routing_id', 'edges', ['routing_id'], schema='false_positive')
+    op.add_column('edges', sa.Column('source_routing_id', sa.BigInteger(), nullable=True), schema='false_positive')
+    op.add_column('edges', sa.Column('target_routing_id', sa.BigInteger(), nullable=True), schema='false_positive')
+
+    op.execute("""
+        UPDATE false_positive.edges e
+        SET source_routing_id = src.routing_id,
+            target_routing_id = tgt.routing_id
+        FROM false_positive.nodes src, false_positive.nodes tgt
+        WHERE src.id = e.source_node_id
+        AND tgt.id = e.target_node_id
+    """)
+
+    op.alter_column('edges', 'source_routing_id', nullable=False, schema='false_positive')
+    op.alter_column('edges', 'target_routing_id', nullable=False, schema='false_positive')
+    op.create_index('ix_edges_source_routing_id', 'edges', ['source_routing_id'], schema='false_positive')
+    op.create_index('ix_edges_target_routing_id', 'edges', ['target_routing_id'], schema='false_positive')
+
+    # Edge set in the shape pgr_dijkstra expects, so routes run in a single statement
+    op.execute("""
+        CREATE VIEW false_positive.routing_edges AS
+        SELECT
+            routing_id AS id,
+            source_routing_id AS source,
+            target_routing_id AS target,
+            distance::float8 AS cost
+        FROM false_positive.edges
+    """)
+
+
+def downgrade() -> None:
+    op.execute('DROP VIEW IF EXISTS false_positive.routing_edges')
+
+    op.drop_index('ix_edges_target_routing_id', table_name='edges', schema='false_positive')
+    op.drop_index('ix_edges_source_routing_id', table_name='edges', schema='false_positive')
+    op.drop_column('edges', 'target_routing_id', schema='false_positive')
+    op.drop_column('edges', 'source_routing_id', schema='false_positive')
+    op.drop_constraint('uq_edges_routing_id', 'edges', schema='false_positive', type_='unique')
+    op.drop_column('edges', 'routing_id', schema='false_positive')
+
+    op.drop_constraint('uq_nodes_routing_id', 'nodes', schema='false_positive', type_='unique')
+    op.drop_column('nodes', 'routing_id', schema='false_positive')
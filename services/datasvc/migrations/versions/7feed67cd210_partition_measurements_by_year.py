@@ -0,0 +1,110 @@
+"""partition_measurements_by_year
+
+Revision ID: 7feed67cd210
+Revises: 7978681a1877
+Create Date: 2025-03-12 11:20:41.308527
+
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7feed67cd210'
+down_revision: Union[str, None] = '7978681a1877'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = 'id, dam_id, timestamp, volume, fill_volume, avg_incoming_flow, avg_outgoing_flow'
+
+
+def upgrade() -> None:
+    op.execute('ALTER TABLE false_positive.dam_bulletin_measurements RENAME TO dam_bulletin_measurements_unpartitioned')
+    op.execute('ALTER INDEX false_positive.dam_bulletin_measurements_pkey RENAME TO dam_bulletin_measurements_unpartitioned_pkey')
+    op.drop_constraint('uq_dam_bulletin_measurements_dam_id_timestamp', 'dam_bulletin_measurements_unpartitioned', schema='false_positive', type_='unique')
+    op.drop_index('ix_dam_bulletin_measurements_dam_id_timestamp', table_name='dam_bulletin_measurements_unpartitioned', schema='false_positive')
+    op.drop_index('ix_dam_bulletin_measurements_timestamp_id', table_name='dam_bulletin_measurements_unpartitioned', schema='false_positive')
+
+    op.execute("""
+        CREATE TABLE false_positive.dam_bulletin_measurements (
+            id uuid NOT NULL,
+            dam_id uuid NOT NULL REFERENCES false_positive.dams (id),
+            timestamp timestamptz NOT NULL,
+            volume numeric,
+            fill_volume numeric,
+            avg_incoming_flow numeric,
+            avg_outgoing_flow numeric
+        ) PARTITION BY RANGE (timestamp)
+    """)
+
+    # One partition per UTC year of the existing bulletins up to next year, and a default
+    # partition for anything outside them; measurements.ensure_measurement_partitions adds
+    # the following years
+    first_year, last_year = op.get_bind().execute(sa.text("""
+        SELECT
+            extract(year FROM min(timestamp) AT TIME ZONE 'UTC')::int,
+            extract(year FROM max(timestamp) AT TIME ZONE 'UTC')::int
+        FROM false_positive.dam_bulletin_measurements_unpartitioned
+    """)).one()
+    this_year = datetime.now(timezone.utc).year
+    first_year = min(first_year or this_year, this_year)
+    last_year = max(last_year or this_year, this_year + 1)
+    for year in range(first_year, last_year + 1):
+        op.execute(f"""
+            CREATE TABLE false_positive.dam_bulletin_measurements_y{year}
+            PARTITION OF false_positive.dam_bulletin_measurements
+            FOR VALUES FROM ('{year}-01-01 00:00:00+00') TO ('{year + 1}-01-01 00:00:00+00')
+        """)
+    op.execute('CREATE TABLE false_positive.dam_bulletin_measurements_default PARTITION OF false_positive.dam_bulletin_measurements DEFAULT')
+
+    op.execute(f"""
+        INSERT INTO false_positive.dam_bulletin_measurements ({COLUMNS})
+        SELECT {COLUMNS} FROM false_positive.dam_bulletin_measurements_unpartitioned
+    """)
+    op.drop_table('dam_bulletin_measurements_unpartitioned', schema='false_positive')
+
+    # Unique indexes of a partitioned table must contain the partition key, so the primary
+    # key becomes (id, timestamp)
+    op.create_primary_key('dam_bulletin_measurements_pkey', 'dam_bulletin_measurements', ['id', 'timestamp'], schema='false_positive')
+    # Conflict target of the bulk ingest upsert
+    op.create_unique_constraint('uq_dam_bulletin_measurements_dam_id_timestamp', 'dam_bulletin_measurements', ['dam_id', 'timestamp'], schema='false_positive')
+    # Per-dam history with from/to filters and (timestamp, id) keyset pagination
+    op.create_index('ix_dam_bulletin_measurements_dam_id_timestamp', 'dam_bulletin_measurements', ['dam_id', 'timestamp', 'id'], schema='false_positive')
+    # Keyset pagination over all dams
+    op.create_index('ix_dam_bulletin_measurements_timestamp_id', 'dam_bulletin_measurements', ['timestamp', 'id'], schema='false_positive')
+    # Bulletins arrive in time order, so a tiny BRIN index serves time range scans over all dams
+    op.execute('CREATE INDEX ix_dam_bulletin_measurements_timestamp_brin ON false_positive.dam_bulletin_measurements USING brin (timestamp)')
+
+
+def downgrade() -> None:
+    op.execute('ALTER TABLE false_positive.dam_bulletin_measurements RENAME TO dam_bulletin_measurements_partitioned')
+    op.execute('ALTER INDEX false_positive.dam_bulletin_measurements_pkey RENAME TO dam_bulletin_measurements_partitioned_pkey')
+    op.drop_constraint('uq_dam_bulletin_measurements_dam_id_timestamp', 'dam_bulletin_measurements_partitioned', schema='false_positive', type_='unique')
+    op.drop_index('ix_dam_bulletin_measurements_dam_id_timestamp', table_name='dam_bulletin_measurements_partitioned', schema='false_positive')
+    op.drop_index('ix_dam_bulletin_measurements_timestamp_id', table_name='dam_bulletin_measurements_partitioned', schema='false_positive')
+
+    op.create_table('dam_bulletin_measurements',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('dam_id', sa.UUID(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('volume', sa.Numeric(), nullable=True),
+    sa.Column('fill_volume', sa.Numeric(), nullable=True),
+    sa.Column('avg_incoming_flow', sa.Numeric(), nullable=True),
+    sa.Column('avg_outgoing_flow', sa.Numeric(), nullable=True),
+    sa.ForeignKeyConstraint(['dam_id'], ['false_positive.dams.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    schema='false_positive'
+    )
+    op.execute(f"""
+        INSERT INTO false_positive.dam_bulletin_measurements ({COLUMNS})
+        SELECT {COLUMNS} FROM false_positive.dam_bulletin_measurements_partitioned
+    """)
+    # Drops the partitions and the BRIN index with it
+    op.drop_table('dam_bulletin_measurements_partitioned', schema='false_positive')
+
+    op.create_unique_constraint('uq_dam_bulletin_measurements_dam_id_timestamp', 'dam_bulletin_measurements', ['dam_id', 'timestamp'], schema='false_positive')
+    op.create_index('ix_dam_bulletin_measurements_dam_id_timestamp', 'dam_bulletin_measurements', ['dam_id', 'timestamp', 'id'], schema='false_positive')
+    op.create_index('ix_dam_bulletin_measurements_timestamp_id', 'dam_bulletin_measurements', ['timestamp', 'id'], schema='false_positive')
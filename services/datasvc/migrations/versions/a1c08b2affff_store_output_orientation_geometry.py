@@ -0,0 +1,92 @@
+"""store_output_orientation_geometry
+
+Revision ID: a1c08b2affff
+Revises: 47d649a6b014
+Create Date: 2025-03-07 18:22:51.447902
+
+"""
+from typing import Sequence, Union
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1c08b2affff'
+down_revision: Union[str, None] = '47d649a6b014'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def flip_coordinates(geojson):
+    """Flip coordinates in a GeoJSON object."""
+    if not geojson or not isinstance(geojson, dict):
+        return geojson
+
+    if geojson.get('type') == 'MultiPolygon':
+        for polygon in geojson.get('coordinates', []):
+            for ring in polygon:
+                for coord in ring:
+                    coord[0], coord[1] = coord[1], coord[0]
+    elif geojson.get('type') == 'Polygon':
+        for ring in geojson.get('coordinates', []):
+            for coord in ring:
+                coord[0], coord[1] = coord[1], coord[0]
+    elif geojson.get('type') == 'Point':
+        coords = geojson.get('coordinates', [])
+        if len(coords) >= 2:
+            coords[0], coords[1] = coords[1], coords[0]
+
+    return geojson
+
+
+def upgrade() -> None:
+    # Pre-encoded JSON of border_geometry, spliced into responses as is
+    op.add_column('dams', sa.Column('border_geometry_json', sa.Text(), nullable=True), schema='false_positive')
+
+    connection = op.get_bind()
+    dams = connection.execute(
+        sa.text("""
+            SELECT id, border_geometry
+            FROM false_positive.dams
+            WHERE border_geometry IS NOT NULL
+        """)
+    ).fetchall()
+
+    # Store the geometry in the orientation the API responds with, so reads no longer
+    # flip it on every request
+    for dam in dams:
+        geometry_json = json.dumps(flip_coordinates(dam.border_geometry), separators=(',', ':'))
+        connection.execute(
+            sa.text("""
+                UPDATE false_positive.dams
+                SET border_geometry = CAST(:geometry AS jsonb),
+                    border_geometry_json = :geometry
+                WHERE id = CAST(:id AS uuid)
+            """),
+            {"id": str(dam.id), "geometry": geometry_json}
+        )
+
+
+def downgrade() -> None:
+    connection = op.get_bind()
+    dams = connection.execute(
+        sa.text("""
+            SELECT id, border_geometry
+            FROM false_positive.dams
+            WHERE border_geometry IS NOT NULL
+        """)
+    ).fetchall()
+
+    for dam in dams:
+        connection.execute(
+            sa.text("""
+                UPDATE false_positive.dams
+                SET border_geometry = CAST(:geometry AS jsonb)
+                WHERE id = CAST(:id AS uuid)
+            """),
+            {"id": str(dam.id), "geometry": json.dumps(flip_coordinates(dam.border_geometry))}
+        )
+
+    op.drop_column('dams', 'border_geometry_json', schema='false_positive')
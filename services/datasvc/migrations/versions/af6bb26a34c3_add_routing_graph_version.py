@@ -0,0 +1,58 @@
+"""add_routing_graph_version
+
+Revision ID: af6bb26a34c3
+Revises: c6b0edd5168c
+Create Date: 2025-03-20 09:41:27.305817
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'af6bb26a34c3'
+down_revision: Union[str, None] = 'c6b0edd5168c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Single-row counter bumped by every statement that changes the routing graph, so the
+    # in-memory graphs notice writes of other processes without scanning nodes and edges
+    op.create_table('routing_graph_version',
+        sa.Column('id', sa.SmallInteger(), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        schema='false_positive'
+    )
+    op.execute('INSERT INTO false_positive.routing_graph_version (id, version) VALUES (1, 0)')
+
+    op.execute("""
+        CREATE FUNCTION false_positive.bump_routing_graph_version() RETURNS trigger AS $$
+        BEGIN
+            UPDATE false_positive.routing_graph_version SET version = version + 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    # Statement-level, so that bulk inserts and COPY loads bump it once
+    op.execute("""
+        CREATE TRIGGER nodes_bump_routing_graph_version
+        AFTER INSERT OR DELETE OR TRUNCATE OR UPDATE OF node_type ON false_positive.nodes
+        FOR EACH STATEMENT EXECUTE FUNCTION false_positive.bump_routing_graph_version()
+    """)
+    op.execute("""
+        CREATE TRIGGER edges_bump_routing_graph_version
+        AFTER INSERT OR DELETE OR TRUNCATE
+            OR UPDATE OF source_node_id, target_node_id, distance ON false_positive.edges
+        FOR EACH STATEMENT EXECUTE FUNCTION false_positive.bump_routing_graph_version()
+    """)
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER IF EXISTS edges_bump_routing_graph_version ON false_positive.edges')
+    op.execute('DROP TRIGGER IF EXISTS nodes_bump_routing_graph_version ON false_positive.nodes')
+    op.execute('DROP FUNCTION IF EXISTS false_positive.bump_routing_graph_version()')
+    op.drop_table('routing_graph_version', schema='false_positive')
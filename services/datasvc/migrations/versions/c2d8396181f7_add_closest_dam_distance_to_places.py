@@ -0,0 +1,27 @@
+"""add_closest_dam_distance_to_places
+
+Revision ID: c2d8396181f7
+Revises: 7fd364adc6ab
+Create Date: 2025-03-04 10:27:55.904117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2d8396181f7'
+down_revision: Union[str, None] = '7fd364adc6ab'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Network distance in meters from the place to closest_dam_id, set by the assignment job
+    op.add_column('places', sa.Column('closest_dam_distance', sa.Numeric(), nullable=True), schema='false_positive')
+
+
+def downgrade() -> None:
+    op.drop_column('places', 'closest_dam_distance', schema='false_positive')
@@ -0,0 +1,43 @@
+"""allow_degenerate_dam_bboxes
+
+Revision ID: c6b0edd5168c
+Revises: 037893775704
+Create Date: 2025-03-19 10:05:12.482913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6b0edd5168c'
+down_revision: Union[str, None] = '037893775704'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BBOX_EXPRESSION = 'ST_SetSRID(ST_FlipCoordinates(ST_Envelope(ST_GeomFromGeoJSON(border_geometry_json))), 4326)'
+
+
+def _add_border_bbox(geometry_type):
+    op.execute(f"""
+        ALTER TABLE false_positive.dams
+        ADD COLUMN border_bbox geometry({geometry_type}, 4326)
+        GENERATED ALWAYS AS ({BBOX_EXPRESSION}) STORED
+    """)
+    op.execute('CREATE INDEX idx_dams_border_bbox ON false_positive.dams USING gist (border_bbox)')
+
+
+def upgrade() -> None:
+    # ST_Envelope returns a POINT or LINESTRING for degenerate outlines, which a Polygon column
+    # rejects, so the box is stored as any geometry type
+    op.execute('DROP INDEX IF EXISTS false_positive.idx_dams_border_bbox')
+    op.drop_column('dams', 'border_bbox', schema='false_positive')
+    _add_border_bbox('Geometry')
+
+
+def downgrade() -> None:
+    op.execute('DROP INDEX IF EXISTS false_positive.idx_dams_border_bbox')
+    op.drop_column('dams', 'border_bbox', schema='false_positive')
+    _add_border_bbox('Polygon')
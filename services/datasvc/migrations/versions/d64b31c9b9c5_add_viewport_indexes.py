@@ -0,0 +1,39 @@
+"""add_viewport_indexes
+
+Revision ID: d64b31c9b9c5
+Revises: 2df36ff4d60e
+Create Date: 2025-03-09 12:15:42.706391
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd64b31c9b9c5'
+down_revision: Union[str, None] = '2df36ff4d60e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Planar index on the node points for bbox (&&) filters; geography boxes are not planar
+    op.execute('CREATE INDEX idx_nodes_location_geometry ON false_positive.nodes USING gist ((location::geometry))')
+
+    # Bounding box of each dam outline, in lng/lat order (outlines are stored as lat/lng)
+    op.execute("""
+        ALTER TABLE false_positive.dams
+        ADD COLUMN border_bbox geometry(Polygon, 4326)
+        GENERATED ALWAYS AS (
+            ST_SetSRID(ST_FlipCoordinates(ST_Envelope(ST_GeomFromGeoJSON(border_geometry_json))), 4326)
+        ) STORED
+    """)
+    op.execute('CREATE INDEX idx_dams_border_bbox ON false_positive.dams USING gist (border_bbox)')
+
+
+def downgrade() -> None:
+    op.execute('DROP INDEX IF EXISTS false_positive.idx_dams_border_bbox')
+    op.drop_column('dams', 'border_bbox', schema='false_positive')
+    op.execute('DROP INDEX IF EXISTS false_positive.idx_nodes_location_geometry')
@@ -0,0 +1,35 @@
+"""add_node_location
+
+Revision ID: eefaaf8f655b
+Revises: c2d8396181f7
+Create Date: 2025-03-05 16:41:09.271530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'eefaaf8f655b'
+down_revision: Union[str, None] = 'c2d8396181f7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Geography point derived from latitude/longitude, so it can never drift from them
+    op.execute("""
+        ALTER TABLE false_positive.nodes
+        ADD COLUMN location geography(Point, 4326)
+        GENERATED ALWAYS AS (
+            ST_SetSRID(ST_MakePoint(longitude::float8, latitude::float8), 4326)::geography
+        ) STORED
+    """)
+    op.execute('CREATE INDEX idx_nodes_location ON false_positive.nodes USING gist (location)')
+
+
+def downgrade() -> None:
+    op.execute('DROP INDEX IF EXISTS false_positive.idx_nodes_location')
+    op.drop_column('nodes', 'location', schema='false_positive')
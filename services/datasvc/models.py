@@ -1,37 +1,68 @@
 import uuid
 
-from geoalchemy2 import Geometry
+from geoalchemy2 import Geography, Geometry
 from sqlalchemy import (
+    BigInteger,
+    Boolean,
     Column,
+    Computed,
     Date,
     DateTime,
     Enum,
     Float,
     ForeignKey,
+    Index,
     Integer,
     Numeric,
+    Sequence,
+    SmallInteger,
     String,
     Table,
     Text,
+    UniqueConstraint,
 )
 from sqlalchemy.dialects.postgresql import JSONB, UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
 
 from .database import Base
 
+# Backing sequences of the bigserial routing ids used by pgRouting
+nodes_routing_id_seq = Sequence(
+    "nodes_routing_id_seq", schema="false_positive", metadata=Base.metadata
+)
+edges_routing_id_seq = Sequence(
+    "edges_routing_id_seq", schema="false_positive", metadata=Base.metadata
+)
+
 
 class Node(Base):
     __tablename__ = "nodes"
     __table_args__ = {"schema": "false_positive"}
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    routing_id = Column(
+        BigInteger,
+        server_default=nodes_routing_id_seq.next_value(),
+        unique=True,
+        nullable=False,
+    )
     display_name = Column(String, nullable=False)
     latitude = Column(Numeric, nullable=False)
     longitude = Column(Numeric, nullable=False)
     node_type = Column(
         Enum("dam", "place", "junction", name="node_type", schema="false_positive"), nullable=False
     )
+    # GiST-indexed point for spatial lookups, generated from latitude/longitude
+    location = deferred(
+        Column(
+            Geography("POINT", srid=4326),
+            Computed(
+                "ST_SetSRID(ST_MakePoint(longitude::float8, latitude::float8), 4326)::geography",
+                persisted=True,
+            ),
+        )
+    )
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -47,12 +78,30 @@ class Edge(Base):
     target_node_id = Column(
         UUID(as_uuid=True), ForeignKey("false_positive.nodes.id"), nullable=False
     )
+    routing_id = Column(
+        BigInteger,
+        server_default=edges_routing_id_seq.next_value(),
+        unique=True,
+        nullable=False,
+    )
+    source_routing_id = Column(BigInteger, nullable=False, index=True)
+    target_routing_id = Column(BigInteger, nullable=False, index=True)
     distance = Column(Numeric, nullable=False)  # meters
     description = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
 
+# Single row whose version is bumped by triggers on every write to nodes or edges, see
+# routing.graph_version
+class RoutingGraphVersion(Base):
+    __tablename__ = "routing_graph_version"
+    __table_args__ = {"schema": "false_positive"}
+
+    id = Column(SmallInteger, primary_key=True)
+    version = Column(BigInteger, nullable=False)
+
+
 # Association table for dam-place relationship
 dam_places = Table(
     "dam_places",
@@ -70,7 +119,20 @@ class Dam(Base):
     __table_args__ = {"schema": "false_positive"}
 
     id = Column(UUID(as_uuid=True), ForeignKey("false_positive.nodes.id"), primary_key=True)
-    border_geometry = Column(JSONB)  # GeoJSON MultiPolygon
+    border_geometry = Column(JSONB)  # GeoJSON MultiPolygon, [lat, lng] as served by the API
+    border_geometry_json = deferred(Column(Text))  # border_geometry pre-encoded as JSON
+    # GiST-indexed bounding box of the outline in lng/lat order, for viewport queries. Any
+    # geometry type, as the envelope of a degenerate outline is a point or a line.
+    border_bbox = deferred(
+        Column(
+            Geometry("GEOMETRY", srid=4326),
+            Computed(
+                "ST_SetSRID(ST_FlipCoordinates(ST_Envelope("
+                "ST_GeomFromGeoJSON(border_geometry_json))), 4326)",
+                persisted=True,
+            ),
+        )
+    )
     max_volume = Column(Numeric)  # m³
     description = Column(Text, server_default="")
     municipality = Column(String, nullable=False)  # Municipality name
@@ -83,6 +145,20 @@ class Dam(Base):
     places = relationship("Place", secondary=dam_places, backref="dams")
 
 
+# Simplified copies of Dam.border_geometry_json, one per level in geometry.GEOMETRY_LODS
+class DamGeometryLod(Base):
+    __tablename__ = "dam_geometry_lods"
+    __table_args__ = {"schema": "false_positive"}
+
+    dam_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("false_positive.dams.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    level = Column(SmallInteger, primary_key=True)
+    geometry_json = Column(Text, nullable=False)
+
+
 class Place(Base):
     __tablename__ = "places"
     __table_args__ = {"schema": "false_positive"}
@@ -95,6 +171,9 @@ class Place(Base):
     radius = Column(Numeric)  # meters
     municipality = Column(String, nullable=False)  # Municipality name
     closest_dam_id = Column(UUID(as_uuid=True), ForeignKey("false_positive.dams.id"), nullable=True)
+    closest_dam_distance = Column(Numeric, nullable=True)  # meters along the edge network
+    # Set by PATCH /places/{id}/closest-dam/{dam_id}; the automatic assignment skips the place
+    closest_dam_manual = Column(Boolean, nullable=False, server_default="false")
 
     # Relationship with closest dam
     closest_dam = relationship("Dam", foreign_keys=[closest_dam_id])
@@ -118,10 +197,40 @@ class Junction(Base):
 
 class DamBulletinMeasurement(Base):
     __tablename__ = "dam_bulletin_measurements"
-    __table_args__ = {"schema": "false_positive"}
+    __table_args__ = (
+        # Conflict target of the bulk ingest upsert
+        UniqueConstraint(
+            "dam_id", "timestamp", name="uq_dam_bulletin_measurements_dam_id_timestamp"
+        ),
+        # Per-dam history with from/to filters and (timestamp, id) keyset pagination
+        Index("ix_dam_bulletin_measurements_dam_id_timestamp", "dam_id", "timestamp", "id"),
+        # Keyset pagination over all dams
+        Index("ix_dam_bulletin_measurements_timestamp_id", "timestamp", "id"),
+        # Bulletins arrive in time order, so a tiny BRIN index serves time range scans
+        Index(
+            "ix_dam_bulletin_measurements_timestamp_brin", "timestamp", postgresql_using="brin"
+        ),
+        # Yearly partitions, see measurements.ensure_measurement_partitions
+        {"schema": "false_positive", "postgresql_partition_by": "RANGE (timestamp)"},
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     dam_id = Column(UUID(as_uuid=True), ForeignKey("false_positive.dams.id"), nullable=False)
+    # Part of the primary key, as the unique indexes of a partitioned table must include it
+    timestamp = Column(DateTime(timezone=True), primary_key=True)
+    volume = Column(Numeric)  # m³
+    fill_volume = Column(Numeric)  # m³
+    avg_incoming_flow = Column(Numeric)  # m³/s
+    avg_outgoing_flow = Column(Numeric)  # m³/s
+
+
+# Copy of the newest DamBulletinMeasurement of each dam, kept current on every write
+class DamLatestMeasurement(Base):
+    __tablename__ = "dam_latest_measurements"
+    __table_args__ = {"schema": "false_positive"}
+
+    dam_id = Column(UUID(as_uuid=True), ForeignKey("false_positive.dams.id"), primary_key=True)
+    measurement_id = Column(UUID(as_uuid=True), nullable=False)
     timestamp = Column(DateTime(timezone=True), nullable=False)
     volume = Column(Numeric)  # m³
     fill_volume = Column(Numeric)  # m³
@@ -129,9 +238,39 @@ class DamBulletinMeasurement(Base):
     avg_outgoing_flow = Column(Numeric)  # m³/s
 
 
+# Mean/min/max of a dam's measurements per UTC week or month, recomputed for the touched
+# buckets on every write so that long-range series skip the raw rows
+class DamMeasurementRollup(Base):
+    __tablename__ = "dam_measurement_rollups"
+    __table_args__ = {"schema": "false_positive"}
+
+    dam_id = Column(UUID(as_uuid=True), ForeignKey("false_positive.dams.id"), primary_key=True)
+    resolution = Column(String, primary_key=True)  # "week" or "month"
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    count = Column(Integer, nullable=False)
+    volume_mean = Column(Float)  # m³
+    volume_min = Column(Float)
+    volume_max = Column(Float)
+    fill_volume_mean = Column(Float)  # m³
+    fill_volume_min = Column(Float)
+    fill_volume_max = Column(Float)
+    avg_incoming_flow_mean = Column(Float)  # m³/s
+    avg_incoming_flow_min = Column(Float)
+    avg_incoming_flow_max = Column(Float)
+    avg_outgoing_flow_mean = Column(Float)  # m³/s
+    avg_outgoing_flow_min = Column(Float)
+    avg_outgoing_flow_max = Column(Float)
+
+
 class DamPrediction(Base):
     __tablename__ = "dam_predictions"
-    __table_args__ = {"schema": "false_positive"}
+    __table_args__ = (
+        # Per-dam predictions with from/to filters and (timestamp, id) keyset pagination
+        Index("ix_dam_predictions_dam_id_timestamp", "dam_id", "timestamp", "id"),
+        # Keyset pagination over all dams
+        Index("ix_dam_predictions_timestamp_id", "timestamp", "id"),
+        {"schema": "false_positive"},
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     dam_id = Column(UUID(as_uuid=True), ForeignKey("false_positive.dams.id"), nullable=False)
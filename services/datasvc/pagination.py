@@ -0,0 +1,48 @@
+import base64
+from datetime import datetime
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+# Response header carrying the cursor of the next page, absent on the last page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(timestamp, row_id):
+    raw = f"{timestamp.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), UUID(row_id)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+
+
+def time_range_page(query, model, from_, to, cursor, limit):
+    """
+    Filter a time series query to [from_, to) and the page after cursor.
+
+    Rows are ordered by (timestamp, id), so each page is an index range scan that starts
+    where the previous one stopped, however deep the client pages.
+    """
+    if from_ is not None:
+        query = query.filter(model.timestamp >= from_)
+    if to is not None:
+        query = query.filter(model.timestamp < to)
+    if cursor is not None:
+        query = query.filter(tuple_(model.timestamp, model.id) > decode_cursor(cursor))
+    query = query.order_by(model.timestamp.asc(), model.id.asc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def set_next_cursor(response, rows, limit):
+    """Point the client at the next page if this one came back full."""
+    if limit is not None and len(rows) == limit:
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last.timestamp, last.id)
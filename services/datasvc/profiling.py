@@ -0,0 +1,167 @@
+import hmac
+import json
+import logging
+import os
+import re
+import time
+import uuid
+
+from fastapi import Header, HTTPException
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+from .instrumentation import current_request_stats
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:  # pyinstrument is optional, profiling is off without it
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+# Profiling is disabled unless a token is configured. Callers enable it for a single request
+# with the PROFILE_HEADER header set to the token. It is never read from the query string,
+# which access logs and the slow request log record.
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN") or None
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Profiles kept in PROFILE_DIR; the oldest ones are deleted as new ones are stored
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "100"))
+PROFILE_HEADER = "x-profile-token"
+PROFILE_ID_HEADER = "x-profile-id"
+# Seconds between stack samples
+PROFILE_INTERVAL = 0.001
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$")
+
+
+def _valid_token(token):
+    return (
+        PROFILE_TOKEN is not None
+        and token is not None
+        and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+    )
+
+
+def profiling_requested(scope):
+    """Whether the request carries a valid profiling token."""
+    # Fetching a stored profile with the token does not profile the fetch
+    if PROFILE_TOKEN is None or scope["type"] != "http" or scope["path"].startswith("/profiles/"):
+        return False
+    return _valid_token(Headers(scope=scope).get(PROFILE_HEADER))
+
+
+def require_profile_token(x_profile_token: str = Header(None)):
+    """Dependency guarding the stored profiles with the same token as the profiling hook."""
+    if not _valid_token(x_profile_token):
+        raise HTTPException(status_code=403, detail="Profiling token required")
+
+
+def profile_path(profile_id, kind):
+    """Path of the stored "speedscope" profile or "sql" timeline of a profiled request."""
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.{kind}.json")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return path
+
+
+def _sql_timeline(scope, status, duration, stats):
+    timeline = {
+        "method": scope["method"],
+        "path": scope["path"],
+        "route": getattr(scope.get("route"), "path", None),
+        "status": status,
+        "duration_ms": duration * 1000,
+    }
+    if stats is None:
+        return timeline
+    timeline.update(
+        statement_count=stats.statement_count,
+        db_ms=stats.db_time * 1000,
+        pool_wait_ms=stats.pool_wait * 1000,
+        # Only the first MAX_RECORDED_STATEMENTS statements of a request are recorded
+        statements=[
+            {
+                "offset_ms": offset * 1000,
+                "duration_ms": statement_duration * 1000,
+                "statement": statement,
+            }
+            for offset, statement_duration, statement in stats.statements
+        ],
+    )
+    return timeline
+
+
+def _store(profile_id, profiler, timeline):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.speedscope.json"), "w") as f:
+        f.write(profiler.output(SpeedscopeRenderer()))
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.sql.json"), "w") as f:
+        json.dump(timeline, f, indent=2)
+    _prune()
+
+
+def _prune():
+    """Delete all but the newest PROFILE_KEEP profiles; ids sort by the time they were taken."""
+    profile_ids = sorted(
+        {
+            name.split(".", 1)[0]
+            for name in os.listdir(PROFILE_DIR)
+            if PROFILE_ID_PATTERN.match(name.split(".", 1)[0])
+        }
+    )
+    for profile_id in profile_ids[: max(len(profile_ids) - PROFILE_KEEP, 0)]:
+        for kind in ("speedscope", "sql"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, f"{profile_id}.{kind}.json"))
+            except FileNotFoundError:  # Pruned concurrently by another worker
+                pass
+
+
+class ProfilingMiddleware:
+    """
+    Run requests carrying the profiling token under pyinstrument's sampling profiler.
+
+    The profile is stored in PROFILE_DIR in speedscope format (a flamegraph viewer, see
+    https://www.speedscope.app), next to the SQL timeline of the request, under the id
+    returned in the X-Profile-Id header. Work handed to the threadpool shows up as the await
+    it is waiting on rather than its own stack.
+
+    Must run inside InstrumentationMiddleware, whose request stats hold the SQL timeline.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not profiling_requested(scope):
+            await self.app(scope, receive, send)
+            return
+        if Profiler is None:
+            logger.warning("Profiling requested but pyinstrument is not installed")
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        status = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message)[PROFILE_ID_HEADER] = profile_id
+            await send(message)
+
+        profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.stop()
+            duration = time.perf_counter() - start
+            timeline = _sql_timeline(scope, status, duration, current_request_stats())
+            await run_in_threadpool(_store, profile_id, profiler, timeline)
+            logger.info("Stored profile %s of %s %s", profile_id, scope["method"], scope["path"])
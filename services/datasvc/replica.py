@@ -0,0 +1,80 @@
+import math
+import os
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import cookie_parser
+
+# Seconds after a write during which the same client reads from the primary, comfortably
+# above the usual streaming replication lag
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+WROTE_COOKIE = "datasvc_wrote"
+# Carries the same time as the cookie, for clients without a cookie jar or on another site
+# (where a SameSite=Lax cookie is not sent); they echo it on the requests that follow
+READ_PRIMARY_HEADER = "X-Read-Primary"
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+def read_only(endpoint):
+    """Mark an endpoint with an unsafe method that does not write, e.g. a query sent as POST."""
+    endpoint.read_only = True
+    return endpoint
+
+
+def wrote_recently(scope):
+    """
+    Whether the client of the request wrote within READ_YOUR_WRITES_SECONDS.
+
+    Read from the X-Read-Primary header if the request has one, and otherwise the cookie.
+    """
+    wrote_until = None
+    for name, value in scope.get("headers", ()):
+        if name == b"x-read-primary":
+            wrote_until = value.decode("latin-1")
+            break
+        if name == b"cookie":
+            wrote_until = cookie_parser(value.decode("latin-1")).get(WROTE_COOKIE, wrote_until)
+    try:
+        return wrote_until is not None and float(wrote_until) > time.time()
+    except ValueError:
+        return False
+
+
+class ReadYourWritesMiddleware:
+    """
+    Mark clients that have just written, so their reads go to the primary for a while.
+
+    Every successful request with an unsafe method sets a cookie holding the time until
+    which get_read_db uses the primary instead of a replica that may lag behind, and returns
+    it in the X-Read-Primary header as well. Endpoints marked read_only do neither.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message):
+            # The router has set the matched route by the time the response starts
+            endpoint = getattr(scope.get("route"), "endpoint", None)
+            if (
+                message["type"] == "http.response.start"
+                and message["status"] < 400
+                and not getattr(endpoint, "read_only", False)
+            ):
+                wrote_until = time.time() + READ_YOUR_WRITES_SECONDS
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "set-cookie",
+                    f"{WROTE_COOKIE}={wrote_until:.3f}; "
+                    f"Max-Age={math.ceil(READ_YOUR_WRITES_SECONDS)}; "
+                    "Path=/; HttpOnly; SameSite=Lax",
+                )
+                headers.append(READ_PRIMARY_HEADER, f"{wrote_until:.3f}")
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -0,0 +1,517 @@
+import heapq
+import os
+import threading
+import time
+from array import array
+
+from sqlalchemy import bindparam, or_, update
+from sqlalchemy.sql import text
+
+from . import models
+
+# "memory" answers routes from RoutingGraph, "pgrouting" runs pgr_dijkstra in the database
+ROUTING_BACKEND = os.getenv("ROUTING_BACKEND", "memory")
+
+# Number of edges added through add_edge before they are folded into the CSR arrays
+COMPACT_THRESHOLD = 1024
+
+# Minimum seconds between two checks of whether the nodes and edges tables changed
+ROUTING_GRAPH_CHECK_SECONDS = float(os.getenv("ROUTING_GRAPH_CHECK_SECONDS", "5"))
+
+
+def _build_csr(adjacency, node_count):
+    offsets = array("q", [0] * (node_count + 1))
+    targets = array("q")
+    weights = array("d")
+    for u in range(node_count):
+        for v, w in adjacency.get(u, ()):
+            targets.append(v)
+            weights.append(w)
+        offsets[u + 1] = len(targets)
+    return offsets, targets, weights
+
+
+def _merge_csr(csr, pending, node_count):
+    offsets, targets, weights = csr
+    adjacency = {}
+    for u in range(len(offsets) - 1):
+        start, end = offsets[u], offsets[u + 1]
+        if start != end:
+            adjacency[u] = list(zip(targets[start:end], weights[start:end]))
+    for u, extra in pending.items():
+        adjacency.setdefault(u, []).extend(extra)
+    return _build_csr(adjacency, node_count)
+
+
+def _with_pending(pending, u, v, w):
+    """Copy of pending with the edge u -> v added."""
+    return {**pending, u: [*pending.get(u, ()), (v, w)]}
+
+
+def _neighbours(csr, pending, u):
+    """(target, weight) pairs of the compacted and the pending edges leaving u."""
+    offsets, targets, weights = csr
+    if u < len(offsets) - 1:
+        start, end = offsets[u], offsets[u + 1]
+        yield from zip(targets[start:end], weights[start:end])
+    yield from pending.get(u, ())
+
+
+def _dijkstra(csr, pending, dist, heap, label=None, prev=None, stop_at=None):
+    """
+    Heap-based Dijkstra over one direction of the graph.
+
+    dist is updated in place starting from the seeds already in heap. If given, label
+    maps every reached node to the seed it was reached from and prev to its
+    predecessor. Stops early once all stop_at nodes are settled. Returns the set of
+    nodes whose distance was improved.
+    """
+    remaining = set(stop_at) if stop_at is not None else None
+    improved = set()
+
+    while heap and (remaining is None or remaining):
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        if remaining is not None:
+            remaining.discard(u)
+        for v, w in _neighbours(csr, pending, u):
+            nd = d + w
+            if nd < dist.get(v, float("inf")):
+                dist[v] = nd
+                if label is not None:
+                    label[v] = label[u]
+                if prev is not None:
+                    prev[v] = u
+                improved.add(v)
+                heapq.heappush(heap, (nd, v))
+    return improved
+
+
+class GraphSnapshot:
+    """
+    One version of the graph, published whole so that a search never mixes two of them.
+
+    load() and compaction replace the snapshot, and add_edge replaces its pending edges.
+    Only node_ids, node_types and index grow in place as nodes are added, which running
+    searches tolerate: existing nodes keep their index, and new ones have no edges yet.
+    """
+
+    def __init__(
+        self, node_ids, node_types, index, csr, reverse_csr, pending=None, reverse_pending=None
+    ):
+        self.node_ids = node_ids  # index -> node UUID
+        self.node_types = node_types  # index -> node_type
+        self.index = index  # node UUID -> index
+        # CSR arrays: the edges leaving node i are targets/weights[offsets[i]:offsets[i + 1]].
+        # The reverse graph is kept alongside for searches that run towards a set of nodes.
+        self.csr = csr
+        self.reverse_csr = reverse_csr
+        # Edges added since the last compaction, index -> [(target index, weight), ...]
+        self.pending = pending or {}
+        self.reverse_pending = reverse_pending or {}
+        self.pending_count = sum(len(edges) for edges in self.pending.values())
+
+    def compacted(self):
+        """A snapshot of the same graph with the pending edges folded into the CSR arrays."""
+        node_count = len(self.node_ids)
+        return GraphSnapshot(
+            self.node_ids,
+            self.node_types,
+            self.index,
+            _merge_csr(self.csr, self.pending, node_count),
+            _merge_csr(self.reverse_csr, self.reverse_pending, node_count),
+        )
+
+    def unwind(self, source, target, dist, prev):
+        """Path from source to target as (node UUID, distance from start) pairs, or None."""
+        if target not in dist:
+            return None
+        path = [target]
+        while path[-1] != source:
+            path.append(prev[path[-1]])
+        path.reverse()
+        return [(self.node_ids[u], dist[u]) for u in path]
+
+    def search(self, source, targets):
+        """Single-source search; returns (dist, prev) of the explored part of the graph."""
+        dist = {source: 0.0}
+        prev = {}
+        _dijkstra(self.csr, self.pending, dist, [(0.0, source)], prev=prev, stop_at=targets)
+        return dist, prev
+
+
+def graph_version(db):
+    """
+    Version of the nodes and edges tables, a counter bumped by triggers on every write.
+
+    One primary key lookup, cheap enough to run every few seconds in every worker.
+    """
+    return db.query(models.RoutingGraphVersion.version).scalar()
+
+
+class RoutingGraph:
+    """Directed edge graph held in memory as CSR arrays keyed by a dense node index."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Held while sync() reloads, so that concurrent requests do not each reload
+        self._load_lock = threading.Lock()
+        self._snapshot = GraphSnapshot([], [], {}, _build_csr({}, 0), _build_csr({}, 0))
+        # graph_version() of the tables the graph was loaded from, and when it was checked
+        self.version = None
+        self._checked_at = float("-inf")
+        # Multi-source search state from the last closest_dams() call, kept so that new
+        # edges can be relaxed into it incrementally
+        self._closest = None
+
+    @property
+    def snapshot(self):
+        """The current GraphSnapshot; read it once and use that for a whole search."""
+        return self._snapshot
+
+    def load(self, db, keep_closest_dams=True):
+        """
+        (Re)build the whole graph from the nodes and edges tables.
+
+        If closest_dams had been run, it is run again on the new graph so that
+        relax_closest_dams keeps following new edges, unless keep_closest_dams is False.
+        """
+        version = graph_version(db)
+        nodes = db.query(models.Node.id, models.Node.node_type).all()
+        edges = db.query(
+            models.Edge.source_node_id, models.Edge.target_node_id, models.Edge.distance
+        ).all()
+
+        node_ids = [node_id for node_id, _ in nodes]
+        index = {node_id: i for i, node_id in enumerate(node_ids)}
+        adjacency = {}
+        reverse_adjacency = {}
+        for source_id, target_id, distance in edges:
+            source = index.get(source_id)
+            target = index.get(target_id)
+            if source is None or target is None:
+                continue
+            adjacency.setdefault(source, []).append((target, float(distance)))
+            reverse_adjacency.setdefault(target, []).append((source, float(distance)))
+        snapshot = GraphSnapshot(
+            node_ids,
+            [node_type for _, node_type in nodes],
+            index,
+            _build_csr(adjacency, len(node_ids)),
+            _build_csr(reverse_adjacency, len(node_ids)),
+        )
+
+        with self._lock:
+            reseed = keep_closest_dams and self._closest is not None
+            self._snapshot = snapshot
+            self._closest = None
+            self.version = version
+            self._checked_at = time.monotonic()
+        if reseed:
+            self.closest_dams()
+
+    def refresh(self, db):
+        """
+        Reload the graph if the nodes or edges tables changed since it was loaded.
+
+        Other workers, jobs and COPY loads write to them behind this process's back. The
+        tables are checked at most every ROUTING_GRAPH_CHECK_SECONDS. Returns whether the
+        graph was reloaded.
+        """
+        now = time.monotonic()
+        if now - self._checked_at < ROUTING_GRAPH_CHECK_SECONDS:
+            return False
+        self._checked_at = now
+        if graph_version(db) == self.version:
+            return False
+        self.load(db)
+        return True
+
+    def sync(self, db, node_ids):
+        """
+        Bring the graph up to date for a search between node_ids, which must all exist.
+
+        They may have been created by another worker process, so the graph is reloaded if it
+        lacks one of them, and otherwise refreshed. Blocks for as long as a reload takes, so
+        call it from a worker thread, not the event loop.
+        """
+        if all(self.has_node(node_id) for node_id in node_ids):
+            self.refresh(db)
+            return
+        with self._load_lock:
+            # Another thread may have reloaded the graph while this one waited
+            if not all(self.has_node(node_id) for node_id in node_ids):
+                self.load(db)
+
+    def has_node(self, node_id):
+        return node_id in self._snapshot.index
+
+    def add_node(self, node_id, node_type):
+        with self._lock:
+            snapshot = self._snapshot
+            if node_id in snapshot.index:
+                return
+            u = len(snapshot.node_ids)
+            snapshot.node_ids.append(node_id)
+            snapshot.node_types.append(node_type)
+            snapshot.index[node_id] = u
+            if node_type == "dam" and self._closest is not None:
+                dist, label = self._closest
+                dist[u] = 0.0
+                label[u] = u
+
+    def add_edge(self, source_id, target_id, distance):
+        with self._lock:
+            snapshot = self._snapshot
+            source = snapshot.index.get(source_id)
+            target = snapshot.index.get(target_id)
+            if source is None or target is None:
+                return
+            # Replaced rather than mutated, so searches already running keep their view
+            snapshot = GraphSnapshot(
+                snapshot.node_ids,
+                snapshot.node_types,
+                snapshot.index,
+                snapshot.csr,
+                snapshot.reverse_csr,
+                _with_pending(snapshot.pending, source, target, float(distance)),
+                _with_pending(snapshot.reverse_pending, target, source, float(distance)),
+            )
+            if snapshot.pending_count >= COMPACT_THRESHOLD:
+                snapshot = snapshot.compacted()
+            self._snapshot = snapshot
+
+    def shortest_path(self, source_id, target_id):
+        """
+        Shortest path between two nodes.
+
+        Returns a list of (node UUID, distance from start) pairs from source to target, or
+        None if the target is unreachable.
+        """
+        snapshot = self._snapshot
+        source = snapshot.index.get(source_id)
+        target = snapshot.index.get(target_id)
+        if source is None or target is None:
+            return None
+
+        dist, prev = snapshot.search(source, [target])
+        return snapshot.unwind(source, target, dist, prev)
+
+    def shortest_paths_from(self, source_id, target_ids):
+        """
+        One-to-many shortest paths, answered by a single search from the source.
+
+        Returns {target UUID: path or None}, with paths shaped as in shortest_path.
+        """
+        snapshot = self._snapshot
+        source = snapshot.index.get(source_id)
+        if source is None:
+            return {target_id: None for target_id in target_ids}
+
+        targets = {
+            target_id: snapshot.index[target_id]
+            for target_id in target_ids
+            if target_id in snapshot.index
+        }
+        dist, prev = snapshot.search(source, targets.values())
+        return {
+            target_id: (
+                snapshot.unwind(source, targets[target_id], dist, prev)
+                if target_id in targets
+                else None
+            )
+            for target_id in target_ids
+        }
+
+    def closest_dams(self):
+        """
+        Network-nearest dam of every node that can reach one.
+
+        One multi-source Dijkstra seeded from every dam over the reverse graph, so the
+        distances are those of the node -> dam routes. Returns {node UUID: (dam UUID,
+        distance)} and keeps the search state for relax_closest_dams.
+        """
+        with self._lock:
+            snapshot = self._snapshot
+            dams = [u for u, node_type in enumerate(snapshot.node_types) if node_type == "dam"]
+            dist = {u: 0.0 for u in dams}
+            label = {u: u for u in dams}
+            heap = [(0.0, u) for u in dams]
+            _dijkstra(snapshot.reverse_csr, snapshot.reverse_pending, dist, heap, label=label)
+            self._closest = (dist, label)
+            return {
+                snapshot.node_ids[u]: (snapshot.node_ids[label[u]], d) for u, d in dist.items()
+            }
+
+    def relax_closest_dams(self, source_id, target_id, distance):
+        """
+        Fold a newly added source -> target edge into the closest_dams state.
+
+        Only nodes whose nearest dam got closer are revisited. Returns the changed entries
+        in the shape of closest_dams, or None if closest_dams has not been run yet.
+        """
+        with self._lock:
+            if self._closest is None:
+                return None
+            snapshot = self._snapshot
+            dist, label = self._closest
+            source = snapshot.index.get(source_id)
+            target = snapshot.index.get(target_id)
+            if source is None or target is None or target not in dist:
+                return {}
+
+            nd = dist[target] + float(distance)
+            if nd >= dist.get(source, float("inf")):
+                return {}
+            dist[source] = nd
+            label[source] = label[target]
+            improved = _dijkstra(
+                snapshot.reverse_csr, snapshot.reverse_pending, dist, [(nd, source)], label=label
+            )
+            improved.add(source)
+            return {
+                snapshot.node_ids[u]: (snapshot.node_ids[label[u]], dist[u]) for u in improved
+            }
+
+
+def _write_closest_dams(db, graph, assignments, only_closer=False):
+    """
+    Bulk-update closest_dam_id/closest_dam_distance for the places among assignments.
+
+    Places whose closest dam was set by hand are never updated. With only_closer, a place
+    is only updated if its stored distance is longer. Another worker, whose graph may be
+    more current, can then not lose a better assignment to this one.
+    """
+    snapshot = graph.snapshot
+    rows = [
+        {"b_id": node_id, "b_dam_id": dam_id, "b_distance": distance}
+        for node_id, (dam_id, distance) in assignments.items()
+        if snapshot.node_types[snapshot.index[node_id]] == "place"
+    ]
+    if not rows:
+        return 0
+    manual = {
+        place_id
+        for (place_id,) in db.query(models.Place.id).filter(
+            models.Place.id.in_([row["b_id"] for row in rows]), models.Place.closest_dam_manual
+        )
+    }
+    rows = [row for row in rows if row["b_id"] not in manual]
+    if not rows:
+        return 0
+    places = models.Place.__table__
+    stmt = (
+        update(places)
+        .where(places.c.id == bindparam("b_id"), places.c.closest_dam_manual.is_(False))
+        .values(closest_dam_id=bindparam("b_dam_id"), closest_dam_distance=bindparam("b_distance"))
+    )
+    if only_closer:
+        stmt = stmt.where(
+            or_(
+                places.c.closest_dam_distance.is_(None),
+                places.c.closest_dam_distance > bindparam("b_distance"),
+            )
+        )
+    db.execute(stmt, rows)
+    return len(rows)
+
+
+def assign_closest_dams(db, graph):
+    """
+    Reload the graph and assign every place its network-nearest dam.
+
+    Places that cannot reach any dam, and those whose closest dam was set by hand, keep
+    their current assignment. Returns the number of (assigned, unreachable) places; the
+    caller commits.
+    """
+    graph.load(db, keep_closest_dams=False)
+    assignments = graph.closest_dams()
+    assigned = _write_closest_dams(db, graph, assignments)
+    snapshot = graph.snapshot
+    unreachable = sum(
+        1
+        for node_id, node_type in zip(snapshot.node_ids, snapshot.node_types)
+        if node_type == "place" and node_id not in assignments
+    )
+    return assigned, unreachable
+
+
+def update_closest_dams(db, graph, edges):
+    """
+    Persist the places whose nearest dam changed after new edges; the caller commits.
+
+    edges are (source UUID, target UUID, distance) triples already added to the graph.
+    """
+    changed = {}
+    for source_id, target_id, distance in edges:
+        # Relaxation only ever shortens distances, so later entries supersede earlier ones
+        changed.update(graph.relax_closest_dams(source_id, target_id, distance) or {})
+    if not changed:
+        return 0
+    return _write_closest_dams(db, graph, changed, only_closer=True)
+
+
+def pgrouting_shortest_path(db, source_id, target_id):
+    """
+    Single-statement pgr_dijkstra over the routing_edges view.
+
+    Returns the same (node UUID, distance from start) pairs as RoutingGraph.shortest_path,
+    or None if there is no path. Both nodes must exist.
+    """
+    # pgr_dijkstra returns no rows for a route from a node to itself
+    if source_id == target_id:
+        return [(source_id, 0.0)]
+    rows = db.execute(
+        text(
+            """
+            SELECT n.id, p.agg_cost
+            FROM pgr_dijkstra(
+                'SELECT id, source, target, cost FROM false_positive.routing_edges',
+                (SELECT routing_id FROM false_positive.nodes WHERE id = :start),
+                (SELECT routing_id FROM false_positive.nodes WHERE id = :end)
+            ) p
+            JOIN false_positive.nodes n ON n.routing_id = p.node
+            ORDER BY p.seq
+            """
+        ),
+        {"start": str(source_id), "end": str(target_id)},
+    ).fetchall()
+    if not rows:
+        return None
+    return [(node_id, float(agg_cost)) for node_id, agg_cost in rows]
+
+
+def pgrouting_shortest_paths_from(db, source_id, target_ids):
+    """One-to-many pgr_dijkstra; returns {target UUID: path or None}."""
+    rows = db.execute(
+        text(
+            """
+            WITH targets AS (
+                SELECT id, routing_id
+                FROM false_positive.nodes
+                WHERE id = ANY(CAST(:targets AS uuid[]))
+            )
+            SELECT t.id AS target_id, n.id, p.agg_cost
+            FROM pgr_dijkstra(
+                'SELECT id, source, target, cost FROM false_positive.routing_edges',
+                (SELECT routing_id FROM false_positive.nodes WHERE id = :start),
+                (SELECT array_agg(routing_id) FROM targets)
+            ) p
+            JOIN targets t ON t.routing_id = p.end_vid
+            JOIN false_positive.nodes n ON n.routing_id = p.node
+            ORDER BY p.end_vid, p.path_seq
+            """
+        ),
+        {"start": str(source_id), "targets": [str(target_id) for target_id in target_ids]},
+    ).fetchall()
+
+    paths = {target_id: None for target_id in target_ids}
+    for target_id, node_id, agg_cost in rows:
+        if paths[target_id] is None:
+            paths[target_id] = []
+        paths[target_id].append((node_id, float(agg_cost)))
+    # A route to the source itself, which pgr_dijkstra leaves out, if the source exists
+    if source_id in paths and db.query(models.Node.id).filter(models.Node.id == source_id).first():
+        paths[source_id] = [(source_id, 0.0)]
+    return paths
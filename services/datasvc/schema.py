@@ -64,6 +64,16 @@ class DamBulletinMeasurement(DamBulletinMeasurementBase):
         from_attributes = True
 
 
+class BulkCreateResult(BaseModel):
+    ids: list[UUID4] = Field(description="Ids of the created rows, in request order")
+
+
+class BulkMeasurementResult(BaseModel):
+    received: int = Field(description="Rows in the request body")
+    inserted: int = Field(description="New (dam_id, timestamp) measurements")
+    updated: int = Field(description="Existing measurements overwritten by the request")
+
+
 class DamBase(BaseModel):
     model_config = {"arbitrary_types_allowed": True}
 
@@ -164,6 +174,29 @@ class ShortestPathResponse(BaseModel):
         from_attributes = True
 
 
+class RoutePair(BaseModel):
+    start_node_id: UUID4
+    end_node_id: UUID4
+
+
+class BatchRouteRequest(BaseModel):
+    pairs: list[RoutePair] = Field(
+        default_factory=list, description="Explicit (start, end) pairs to route"
+    )
+    sources: list[UUID4] = Field(
+        default_factory=list, description="Routed to every node in targets"
+    )
+    targets: list[UUID4] = Field(default_factory=list)
+
+
+class BatchRouteResult(BaseModel):
+    start_node_id: UUID4
+    end_node_id: UUID4
+    path: Optional[list[ShortestPathNode]] = None
+    total_distance: Optional[float] = None
+    error: Optional[str] = None
+
+
 class PointNode(BaseModel):
     id: Literal["point"]  # Special ID to identify this as a point node
     node_type: Literal["point"]
@@ -195,6 +228,9 @@ class PointRouteResponse(BaseModel):
     path: list[Union[PointNode, ShortestPathNode]]
     total_distance: float
     place: "Place"
+    inside_place: bool = Field(
+        description="Whether the point is inside the place, or the place is only the nearest one"
+    )
     water_metrics: WaterMetrics
 
     class Config:
@@ -236,7 +272,18 @@ class PlaceCreate(PlaceBase, NodeFieldsMixin):
 
 
 class Place(PlaceBase, NodeResponseMixin):
-    pass
+    closest_dam_distance: Optional[float] = Field(
+        default=None, description="Network distance to the closest dam in meters"
+    )
+    closest_dam_manual: bool = Field(
+        default=False,
+        description="The closest dam was set by hand and is kept by the automatic assignment",
+    )
+
+
+class ClosestDamAssignmentResult(BaseModel):
+    assigned: int = Field(description="Places assigned their network-nearest dam")
+    unreachable: int = Field(description="Places with no route to any dam")
 
 
 class JunctionBase(BaseModel):
@@ -268,14 +315,37 @@ class DamPredictionCreate(DamPredictionBase):
 class DamPrediction(DamPredictionBase):
     id: UUID4
     created_at: datetime
-    fill_percentage: float = Field(
-        description="Percentage of the dam's maximum volume that is filled"
+    fill_percentage: Optional[float] = Field(
+        default=None,
+        description="Percentage of the dam's maximum volume that is filled, null without one",
     )
 
     class Config:
         from_attributes = True
 
 
+class SeriesStats(BaseModel):
+    mean: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+
+
+class DamMeasurementBucket(BaseModel):
+    bucket_start: datetime
+    count: int = Field(description="Number of measurements in the bucket")
+    volume: SeriesStats
+    fill_volume: SeriesStats
+    avg_incoming_flow: SeriesStats
+    avg_outgoing_flow: SeriesStats
+
+
+class DamPredictionBucket(BaseModel):
+    bucket_start: datetime
+    count: int = Field(description="Number of predictions in the bucket")
+    fill_volume: SeriesStats
+    fill_percentage: SeriesStats
+
+
 class SatelliteImageBase(BaseModel):
     model_config = {"arbitrary_types_allowed": True}
 
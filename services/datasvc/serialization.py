@@ -0,0 +1,36 @@
+import orjson
+from fastapi.responses import Response
+from sqlalchemy import Float, Numeric, cast
+
+
+def schema_columns(response_schema, *models):
+    """
+    Columns for the fields of response_schema, each taken from the first model that has it.
+
+    Numeric columns are cast to float8 in SQL so the rows only hold JSON-native values.
+    Fields that no model has a column for are left for the caller to select.
+    """
+    columns = []
+    for name in response_schema.model_fields:
+        column = next(
+            (model.__table__.c[name] for model in models if name in model.__table__.c), None
+        )
+        if column is None:
+            continue
+        if isinstance(column.type, Numeric) and not isinstance(column.type, Float):
+            column = cast(column, Float)
+        columns.append(column.label(name))
+    return columns
+
+
+def orjson_response(rows):
+    """
+    Encode result rows straight to a JSON array with orjson.
+
+    Bypasses response_model validation, so the rows must already carry exactly the fields of
+    the endpoint's schema (see schema_columns); the schema still documents the endpoint.
+    """
+    return Response(
+        content=orjson.dumps([row._asdict() for row in rows], option=orjson.OPT_UTC_Z),
+        media_type="application/json",
+    )
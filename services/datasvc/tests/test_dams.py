@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from .conftest import statements_of
+
+DAM_COUNT = 20
+
+
+@pytest.fixture(scope="module")
+def dam_ids(client):
+    """DAM_COUNT dams, each with two places and a few measurements."""
+    places = client.post(
+        "/places/bulk",
+        json=[
+            {
+                "display_name": f"Place {i}",
+                "latitude": 42.0 + i * 0.01,
+                "longitude": 24.0,
+                "population": 1000,
+                "consumption_per_capita": 0.1,
+                "water_price": 2.5,
+                "non_dam_incoming_flow": 0.0,
+                "radius": 1000.0,
+            }
+            for i in range(2 * DAM_COUNT)
+        ],
+    )
+    assert places.status_code == 200, places.text
+    place_ids = places.json()["ids"]
+
+    dams = client.post(
+        "/dams/bulk",
+        json=[
+            {
+                "display_name": f"Dam {i}",
+                "latitude": 42.0 + i * 0.01,
+                "longitude": 25.0,
+                "max_volume": 1000000.0,
+                "place_ids": place_ids[2 * i : 2 * i + 2],
+            }
+            for i in range(DAM_COUNT)
+        ],
+    )
+    assert dams.status_code == 200, dams.text
+    ids = dams.json()["ids"]
+
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    measurements = client.post(
+        "/measurements/bulk",
+        json=[
+            {
+                "dam_id": dam_id,
+                "timestamp": (today - timedelta(days=day)).isoformat(),
+                "volume": 500000.0 + day,
+                "fill_volume": 400000.0 + day,
+                "avg_incoming_flow": 1.0,
+                "avg_outgoing_flow": 0.5,
+            }
+            for dam_id in ids
+            for day in range(3)
+        ],
+    )
+    assert measurements.status_code == 200, measurements.text
+    return ids
+
+
+def test_dam_list_runs_constant_number_of_queries(client, dam_ids):
+    few = statements_of(client, "/dams?limit=2", "/dams")
+    many = statements_of(client, f"/dams?limit={len(dam_ids)}", "/dams")
+    assert few > 0
+    assert many == few
+
+
+@pytest.mark.parametrize("zoom", [6, 10])
+def test_simplified_dam_list_runs_constant_number_of_queries(client, dam_ids, zoom):
+    # The test dams have no outlines, so every one takes the full outline fallback
+    few = statements_of(client, f"/dams?limit=2&zoom={zoom}", "/dams")
+    many = statements_of(client, f"/dams?limit={len(dam_ids)}&zoom={zoom}", "/dams")
+    assert many == few
@@ -0,0 +1,27 @@
+from datetime import datetime, timezone
+
+
+def test_duplicate_measurement_conflicts(client):
+    dam = client.post(
+        "/dams",
+        json={"display_name": "Dam", "latitude": 42.7, "longitude": 23.3, "max_volume": 1e6},
+    )
+    assert dam.status_code == 200, dam.text
+    dam_id = dam.json()["id"]
+    measurement = {
+        "dam_id": dam_id,
+        "timestamp": datetime.now(timezone.utc).replace(microsecond=0).isoformat(),
+        "volume": 500000.0,
+        "fill_volume": 400000.0,
+        "avg_incoming_flow": 1.0,
+        "avg_outgoing_flow": 0.5,
+    }
+
+    first = client.post(f"/dams/{dam_id}/measurements", json=measurement)
+    assert first.status_code == 200, first.text
+    again = client.post(f"/dams/{dam_id}/measurements", json={**measurement, "volume": 1.0})
+    assert again.status_code == 409, again.text
+
+    # The conflicting write left the stored measurement as it was
+    stored = client.get(f"/dams/{dam_id}/measurements").json()
+    assert [row["volume"] for row in stored] == [500000.0]
@@ -0,0 +1,120 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+
+@pytest.fixture
+def dam_with_predictions(client):
+    """Create a dam with a week of daily predictions; returns a function of its max volume."""
+
+    def create(max_volume):
+        response = client.post(
+            "/dams",
+            json={
+                "display_name": "Scraped dam",
+                "latitude": 42.5,
+                "longitude": 25.5,
+                "max_volume": 0.0 if max_volume is None else max_volume,
+            },
+        )
+        assert response.status_code == 200, response.text
+        dam_id = uuid.UUID(response.json()["id"])
+
+        if max_volume is None:
+            # The API has no way to clear max_volume, the importers write NULL directly
+            from .. import models
+            from ..database import SessionLocal
+
+            with SessionLocal() as db:
+                db.query(models.Dam).filter(models.Dam.id == dam_id).update(
+                    {models.Dam.max_volume: None}
+                )
+                db.commit()
+
+        start = datetime.now(timezone.utc) - timedelta(days=7)
+        for day in range(7):
+            created = client.post(
+                f"/dams/{dam_id}/predictions",
+                json={
+                    "dam_id": str(dam_id),
+                    "timestamp": (start + timedelta(days=day)).isoformat(),
+                    "fill_volume": 1000.0 + day,
+                },
+            )
+            assert created.status_code == 200, created.text
+        return dam_id
+
+    return create
+
+
+@pytest.mark.parametrize("max_volume", [0.0, None])
+def test_prediction_series_without_max_volume(client, dam_with_predictions, max_volume):
+    dam_id = dam_with_predictions(max_volume)
+
+    response = client.get(f"/dams/{dam_id}/predictions/series?resolution=day")
+
+    assert response.status_code == 200, response.text
+    buckets = response.json()
+    assert sum(bucket["count"] for bucket in buckets) == 7
+    for bucket in buckets:
+        assert bucket["fill_volume"]["mean"] is not None
+        assert bucket["fill_percentage"] == {"mean": None, "min": None, "max": None}
+
+
+def test_prediction_series_percentages(client, dam_with_predictions):
+    dam_id = dam_with_predictions(10000.0)
+
+    response = client.get(f"/dams/{dam_id}/predictions/series?resolution=day")
+
+    assert response.status_code == 200, response.text
+    for bucket in response.json():
+        assert bucket["fill_percentage"]["mean"] == pytest.approx(
+            bucket["fill_volume"]["mean"] / 100
+        )
+
+
+@pytest.mark.parametrize("max_volume", [0.0, None, 10000.0])
+def test_prediction_listings_match_their_schema(client, dam_with_predictions, max_volume):
+    from ..schema import DamPrediction
+
+    dam_id = dam_with_predictions(max_volume)
+
+    # Both listings encode rows with orjson, bypassing the response_model validation
+    for path in (f"/dams/{dam_id}/predictions", "/predictions?limit=1000"):
+        response = client.get(path)
+        assert response.status_code == 200, response.text
+        rows = [row for row in response.json() if row["dam_id"] == str(dam_id)]
+        assert len(rows) == 7
+        for row in rows:
+            assert set(row) == set(DamPrediction.model_fields)
+            prediction = DamPrediction.model_validate(row)
+            if max_volume:
+                assert prediction.fill_percentage == pytest.approx(prediction.fill_volume / 100)
+            else:
+                assert prediction.fill_percentage is None
+
+
+@pytest.mark.parametrize("max_volume", [0.0, None, 10000.0])
+def test_single_prediction(client, dam_with_predictions, max_volume):
+    from ..schema import DamPrediction
+
+    dam_id = dam_with_predictions(max_volume)
+    listed = client.get(f"/dams/{dam_id}/predictions").json()
+
+    for row in listed:
+        response = client.get(f"/predictions/{row['id']}")
+        assert response.status_code == 200, response.text
+        assert DamPrediction.model_validate(response.json()) == DamPrediction.model_validate(row)
+
+    created = client.post(
+        f"/dams/{dam_id}/predictions",
+        json={
+            "dam_id": str(dam_id),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "fill_volume": 2000.0,
+        },
+    )
+    assert created.status_code == 200, created.text
+    expected = 20.0 if max_volume else None
+    assert created.json()["fill_percentage"] == expected
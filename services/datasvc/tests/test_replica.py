@@ -0,0 +1,42 @@
+import time
+
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from ..replica import READ_PRIMARY_HEADER, WROTE_COOKIE, ReadYourWritesMiddleware, wrote_recently
+
+
+def scope_with(*headers):
+    return {"headers": [(name.encode(), value.encode()) for name, value in headers]}
+
+
+def test_wrote_recently_from_header_or_cookie():
+    future = f"{time.time() + 60:.3f}"
+    past = f"{time.time() - 60:.3f}"
+
+    assert wrote_recently(scope_with(("x-read-primary", future)))
+    assert wrote_recently(scope_with(("cookie", f"{WROTE_COOKIE}={future}")))
+    assert not wrote_recently(scope_with(("x-read-primary", past)))
+    assert not wrote_recently(scope_with(("x-read-primary", "yes")))
+    assert not wrote_recently(scope_with())
+    # The header wins over a cookie, so a client can end its primary reads early
+    assert not wrote_recently(
+        scope_with(("cookie", f"{WROTE_COOKIE}={future}"), ("x-read-primary", past))
+    )
+
+
+def test_writes_return_the_read_primary_header():
+    async def write(request):
+        return PlainTextResponse("ok")
+
+    app = Starlette(routes=[Route("/things", write, methods=["GET", "POST"])])
+    app.add_middleware(ReadYourWritesMiddleware)
+    client = TestClient(app)
+
+    assert READ_PRIMARY_HEADER not in client.get("/things").headers
+    response = client.post("/things")
+    wrote_until = response.headers[READ_PRIMARY_HEADER]
+    assert response.cookies[WROTE_COOKIE] == wrote_until
+    assert wrote_recently(scope_with(("x-read-primary", wrote_until)))
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def create_node(client):
+    """Create a dam or place at the given coordinates; returns its id."""
+
+    def create(kind, latitude, longitude):
+        if kind == "dam":
+            payload = {"display_name": "Dam", "max_volume": 1e6}
+        else:
+            payload = {
+                "display_name": "Place",
+                "population": 1000,
+                "consumption_per_capita": 0.1,
+                "water_price": 2.5,
+                "non_dam_incoming_flow": 0.0,
+                "radius": 1000.0,
+            }
+        response = client.post(
+            f"/{kind}s", json={**payload, "latitude": latitude, "longitude": longitude}
+        )
+        assert response.status_code == 200, response.text
+        return response.json()["id"]
+
+    return create
+
+
+def graph_version():
+    from ..database import SessionLocal
+    from ..routing import graph_version
+
+    with SessionLocal() as db:
+        return graph_version(db)
+
+
+def test_graph_version_follows_graph_writes(client, create_node):
+    dam_id = create_node("dam", 42.1, 23.1)
+    place_id = create_node("place", 42.2, 23.2)
+
+    before = graph_version()
+    edge = client.post("/edges", json={"source_node_id": place_id, "target_node_id": dam_id})
+    assert edge.status_code == 200, edge.text
+    after_edge = graph_version()
+    assert after_edge > before
+
+    # Writes that leave the graph as it is do not invalidate it
+    renamed = client.patch(f"/dams/{dam_id}", json={"display_name": "Renamed dam"})
+    assert renamed.status_code == 200, renamed.text
+    assert graph_version() == after_edge
+
+
+@pytest.mark.parametrize("backend", ["memory", "pgrouting"])
+def test_route_to_itself_is_the_node_alone(client, create_node, monkeypatch, backend):
+    from .. import routing
+
+    monkeypatch.setattr(routing, "ROUTING_BACKEND", backend)
+    dam_id = create_node("dam", 42.3, 23.3)
+
+    response = client.get(f"/routes/{dam_id}/{dam_id}")
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert [node["id"] for node in body["path"]] == [dam_id]
+    assert body["total_distance"] == 0.0
+
+    pair = {"start_node_id": dam_id, "end_node_id": dam_id}
+    batch = client.post("/routes/batch", json={"pairs": [pair]})
+    assert batch.status_code == 200, batch.text
+    [result] = [json.loads(line) for line in batch.text.splitlines()]
+    assert [node["id"] for node in result["path"]] == [dam_id]
+    assert result["total_distance"] == 0.0
+
+
+def test_manual_closest_dam_survives_automatic_assignment(client, create_node):
+    far_dam = create_node("dam", 43.0, 26.0)
+    chosen_dam = create_node("dam", 43.5, 26.5)
+    place_id = create_node("place", 43.01, 26.01)
+    edge = client.post("/edges", json={"source_node_id": place_id, "target_node_id": far_dam})
+    assert edge.status_code == 200, edge.text
+
+    chosen = client.patch(f"/places/{place_id}/closest-dam/{chosen_dam}")
+    assert chosen.status_code == 200, chosen.text
+    assert chosen.json()["closest_dam_manual"] is True
+
+    # A new, shorter route to another dam is relaxed into the closest dams incrementally
+    near_dam = create_node("dam", 43.011, 26.011)
+    edge = client.post("/edges", json={"source_node_id": place_id, "target_node_id": near_dam})
+    assert edge.status_code == 200, edge.text
+    assert client.get(f"/places/{place_id}").json()["closest_dam_id"] == chosen_dam
+
+    # and the full reassignment leaves it alone as well
+    assigned = client.post("/places/closest-dams")
+    assert assigned.status_code == 200, assigned.text
+    place = client.get(f"/places/{place_id}").json()
+    assert place["closest_dam_id"] == chosen_dam
+    assert place["closest_dam_distance"] is None
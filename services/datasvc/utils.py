@@ -1,5 +1,7 @@
 import math
 
+import numpy as np
+
 
 def calculate_spherical_distance(lat1, lng1, lat2, lng2):
     R = 6371  # Earth's radius in km
@@ -11,3 +13,57 @@ def calculate_spherical_distance(lat1, lng1, lat2, lng2):
     )
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
     return R * c
+
+
+def calculate_spherical_distances(lat1, lng1, lat2, lng2):
+    """calculate_spherical_distance over whole arrays of coordinates at once, in km."""
+    R = 6371  # Earth's radius in km
+    lat1, lng1, lat2, lng2 = (
+        np.radians(np.asarray(x, dtype=float)) for x in (lat1, lng1, lat2, lng2)
+    )
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    )
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return R * c
+
+
+def largest_triangle_three_buckets(points, threshold):
+    """
+    Downsample (x, y) points to at most threshold points, keeping the visual shape.
+
+    Largest-Triangle-Three-Buckets: the first and last points are kept and every bucket in
+    between contributes the point forming the largest triangle with the previously kept
+    point and the average of the next bucket. Returns the indexes of the kept points.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    kept = [0]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_start = end
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+
+        next_points = points[next_start:next_end]
+        avg_x = sum(x for x, _ in next_points) / len(next_points)
+        avg_y = sum(y for _, y in next_points) / len(next_points)
+
+        ax, ay = points[a]
+        best_area = -1.0
+        best = start
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+        kept.append(best)
+        a = best
+    kept.append(n - 1)
+    return kept
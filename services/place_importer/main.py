@@ -1,7 +1,7 @@
 import requests
 
 API_BASE_URL = "http://localhost:8000"
-CREATE_PLACE_ENDPOINT = f"{API_BASE_URL}/places"
+CREATE_PLACES_ENDPOINT = f"{API_BASE_URL}/places/bulk"
 
 DEFAULT_WATER_PRICE = 1.5
 FLOW_PERCENTAGE = 0.1
@@ -37,24 +37,25 @@ places_data = [
     {"display_name": "Хасково", "latitude": 41.9391, "longitude": 25.5632, "population": 75000, "consumption_per_capita": 0.083}
 ]
 
-def create_place(place_data):
+def prepare_place(place_data):
     place_data["water_price"] = DEFAULT_WATER_PRICE
     place_data["non_dam_incoming_flow"] = place_data["consumption_per_capita"] * FLOW_PERCENTAGE
     place_data["radius"] = max(5.0, place_data["population"] / 10000)
     place_data["municipality"] = place_data["display_name"]
-    
+    return place_data
+
+
+def create_places(places):
     headers = {
         "Content-Type": "application/json",
     }
-    response = requests.post(CREATE_PLACE_ENDPOINT, json=place_data, headers=headers)
+    response = requests.post(CREATE_PLACES_ENDPOINT, json=places, headers=headers)
     
     if response.status_code == 200:
-        print(f"Place '{place_data['display_name']}' created successfully.")
+        print(f"{len(places)} places created successfully.")
     else:
-        print(f"Failed to create place '{place_data['display_name']}'")
+        print(f"Failed to create {len(places)} places")
         print("Status Code:", response.status_code)
         print("Response:", response.json())
 
-for place in places_data:
-    create_place(place)
-
+create_places([prepare_place(place) for place in places_data])
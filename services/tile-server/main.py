@@ -1,9 +1,49 @@
-from fastapi import FastAPI, HTTPException
+from typing import Optional
+
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+import gzip
 import os
+import tempfile
+
+try:
+    import brotli
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # brotli is optional, every client accepts gzip
+    brotli = None
+
+# Compress responses above this many bytes
+COMPRESSION_MIN_SIZE = 1024
+
+# Precompressed copies kept next to each GeoJSON file, in order of preference
+GEOJSON_ENCODINGS = [("br", ".br"), ("gzip", ".gz")] if brotli else [("gzip", ".gz")]
+
+
+class CompressionMiddleware:
+    """
+    Compress responses, except PNG tiles (compressed already) and GeoJSON, which
+    serve_geojson negotiates itself from precompressed files.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        if brotli:
+            self.compressed = BrotliMiddleware(app, minimum_size=COMPRESSION_MIN_SIZE, gzip_fallback=True)
+        else:
+            self.compressed = GZipMiddleware(app, minimum_size=COMPRESSION_MIN_SIZE)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith((".png", "/geojson")):
+            await self.app(scope, receive, send)
+        else:
+            await self.compressed(scope, receive, send)
+
 
 app = FastAPI()
+app.add_middleware(CompressionMiddleware)
 
 # Enable CORS for all routes
 app.add_middleware(
@@ -31,18 +71,85 @@ async def serve_tile(dam_id: str, year: int, month: int, z: int, x: int, y: int)
         raise HTTPException(status_code=404, detail="Tile Not Found")
 
 
+def _compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9)
+
+
+def precompress(path):
+    """Write the compressed copies of a file that are missing or older than the file."""
+    data = None
+    for encoding, suffix in GEOJSON_ENCODINGS:
+        target = path + suffix
+        if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+            continue
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        # Write aside and rename, so concurrent requests never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(_compress(data, encoding))
+        os.replace(tmp_path, target)
+
+
+def precompress_all(directory=GEOJSON_DIR):
+    """Precompress every GeoJSON file under directory, e.g. after new ones were generated."""
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(".geojson"):
+                precompress(os.path.join(root, name))
+
+
+def _accepted_encodings(accept_encoding):
+    """Content codings listed in an Accept-Encoding header, minus those with q=0."""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if coding.strip():
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
 @app.get("/tiles/{dam_id}/{year}/{month}/geojson")
-async def serve_geojson(dam_id: str, year: int, month: int):
-    """Serves GeoJSON files from the tile directory."""
+async def serve_geojson(
+    dam_id: str, year: int, month: int, accept_encoding: Optional[str] = Header(None)
+):
+    """Serves GeoJSON files from the tile directory, precompressed when the client allows."""
     geojson_path = os.path.join(GEOJSON_DIR, dam_id, f'{year}_{month}.geojson')
 
-    if os.path.exists(geojson_path):
-        return FileResponse(geojson_path)
-    else:
+    if not os.path.exists(geojson_path):
         raise HTTPException(status_code=404, detail="GeoJSON Not Found")
 
+    # Compressed once per file version instead of on every hit
+    await run_in_threadpool(precompress, geojson_path)
+    headers = {"Vary": "Accept-Encoding"}
+    accepted = _accepted_encodings(accept_encoding)
+    for encoding, suffix in GEOJSON_ENCODINGS:
+        if encoding in accepted or "*" in accepted:
+            return FileResponse(
+                geojson_path + suffix,
+                media_type="application/geo+json",
+                headers={**headers, "Content-Encoding": encoding},
+            )
+    return FileResponse(geojson_path, media_type="application/geo+json", headers=headers)
+
 # Run the application with Uvicorn (recommended for FastAPI)
 if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] == ["precompress"]:
+        precompress_all()
+        sys.exit()
+
     import uvicorn
 
     uvicorn.run(app, host="0.0.0.0", port=8001, log_level="debug")